@@ -0,0 +1,8 @@
+"""Helper modules for running the course examples on real-size data.
+
+The lectures use hfst_dev directly on toy grammars. The modules in this
+package wrap the same hfst_dev calls for work on full word lists, corpora
+and larger grammars. Import them from the submodules, e.g.
+
+    from compmorph.bulk import analyze_batched
+"""
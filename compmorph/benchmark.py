@@ -0,0 +1,209 @@
+"""Benchmarks for bulk lookup over word lists.
+
+Each configuration is run on each word list in a separate process, so that
+the peak resident set size reported for a configuration is not affected by
+the others. The results are written as JSON together with the hfst_dev
+version, so that runs can be compared between versions.
+
+    python3 -m compmorph.benchmark analyzer.hfst Lecture5/*-words.txt -o bench.json
+
+Configurations:
+
+    plain      HfstTransducer.lookup on the transducer as read from file
+    optimized  lookup after lookup_optimize(), as in Assignment 1.1
+    cached     as optimized, through compmorph.cache.LookupCache
+    parallel   compmorph.parallel.analyze_parallel (throughput only)
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import time
+import traceback
+
+import hfst_dev
+from hfst_dev import HfstTransducer
+
+from compmorph.bulk import optimized_for_lookup, read_words
+from compmorph.cache import LookupCache
+from compmorph.parallel import analyze_parallel
+
+CONFIGURATIONS = ('plain', 'optimized', 'cached', 'parallel')
+
+
+def percentile(sorted_values, p):
+    """Return the *p*th percentile of *sorted_values* (nearest rank)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def peak_rss_kb():
+    """Return the peak resident set size of this process and its children.
+
+    The value is in kilobytes (ru_maxrss is in bytes on macOS).
+    """
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    if sys.platform == 'darwin':
+        rss //= 1024
+    return rss
+
+
+def _timed_lookups(lookup, words):
+    latencies = []
+    clock = time.perf_counter
+    for word in words:
+        start = clock()
+        lookup(word)
+        latencies.append(clock() - start)
+    return latencies
+
+
+def run_configuration(configuration, analyzer_path, word_list_path,
+                      processes=None, cache_size=100000):
+    """Run one benchmark in the current process and return a result dict.
+
+    Latencies are in microseconds. The parallel configuration measures
+    only throughput.
+    """
+    if configuration not in CONFIGURATIONS:
+        raise ValueError('unknown configuration: ' + configuration)
+    start = time.perf_counter()
+    if configuration == 'parallel':
+        load_seconds = 0.0
+        words = 0
+        for chunk in analyze_parallel(analyzer_path, word_list_path,
+                                      processes=processes):
+            words += sum(analysis.count for analysis in chunk)
+        seconds = time.perf_counter() - start
+        latencies = []
+    else:
+        analyzer = HfstTransducer.read_from_file(analyzer_path)
+        if configuration in ('optimized', 'cached'):
+            analyzer = optimized_for_lookup(analyzer)
+        if configuration == 'cached':
+            analyzer = LookupCache(analyzer, max_entries=cache_size)
+        load_seconds = time.perf_counter() - start
+        word_list = list(read_words(word_list_path))
+        start = time.perf_counter()
+        latencies = _timed_lookups(analyzer.lookup, word_list)
+        seconds = time.perf_counter() - start
+        words = len(word_list)
+        latencies.sort()
+    return {
+        'configuration': configuration,
+        'word_list': os.path.basename(word_list_path),
+        'words': words,
+        'load_seconds': load_seconds,
+        'seconds': seconds,
+        'words_per_second': words / seconds if seconds else 0.0,
+        'latency_us': {
+            'p50': percentile(latencies, 50) * 1e6,
+            'p95': percentile(latencies, 95) * 1e6,
+            'p99': percentile(latencies, 99) * 1e6,
+        } if latencies else None,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def _run_in_child(queue, function, args):
+    # Send back (True, result) or (False, the traceback of the exception).
+    try:
+        result = function(*args)
+    except BaseException:
+        queue.put((False, traceback.format_exc()))
+    else:
+        queue.put((True, result))
+
+
+def call_isolated(function, *args):
+    """Return function(*args), called in a fresh process.
+
+    *function* must be defined at the top level of a module and its result
+    must be picklable. If it raises, or the process dies, RuntimeError is
+    raised with the traceback or the exit code of the process.
+    """
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=_run_in_child,
+                              args=(results, function, args))
+    process.start()
+    try:
+        while True:
+            try:
+                ok, result = results.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if not process.is_alive() and results.empty():
+                    raise RuntimeError('%s died with exit code %s'
+                                       % (function.__name__, process.exitcode))
+    finally:
+        process.join()
+    if not ok:
+        raise RuntimeError('%s failed in a child process:\n%s'
+                           % (function.__name__, result))
+    return result
+
+
+def run_isolated(*args):
+    """Call run_configuration with *args* in a fresh process."""
+    return call_isolated(run_configuration, *args)
+
+
+def run_benchmarks(analyzer_path, word_list_paths,
+                   configurations=CONFIGURATIONS, processes=None,
+                   cache_size=100000):
+    """Run all *configurations* on all word lists and return a report dict."""
+    results = []
+    for word_list_path in word_list_paths:
+        for configuration in configurations:
+            results.append(run_isolated(configuration, analyzer_path,
+                                        word_list_path, processes,
+                                        cache_size))
+    return {
+        'hfst_dev_version': hfst_dev.__version__,
+        'python_version': sys.version.split()[0],
+        'cpus': os.cpu_count(),
+        'analyzer': os.path.basename(analyzer_path),
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark lookup of word lists with an analyzer.')
+    parser.add_argument('analyzer', help='analyzer in .hfst format')
+    parser.add_argument('word_lists', nargs='+',
+                        help='files with one word per line')
+    parser.add_argument('-c', '--configurations', default=','.join(CONFIGURATIONS),
+                        help='comma-separated list of configurations '
+                             '(default: %(default)s)')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='worker processes for the parallel configuration')
+    parser.add_argument('--cache-size', type=int, default=100000,
+                        help='entries in the lookup cache (default: %(default)s)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+    configurations = args.configurations.split(',')
+    for configuration in configurations:
+        if configuration not in CONFIGURATIONS:
+            parser.error('unknown configuration: ' + configuration)
+    report = run_benchmarks(args.analyzer, args.word_lists, configurations,
+                            args.processes, args.cache_size)
+    text = json.dumps(report, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
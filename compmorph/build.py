@@ -0,0 +1,236 @@
+"""Building the compiled transducers of all lectures.
+
+The lecture directories contain lexc, twolc and xfst sources that the
+notebooks compile into .hfst files. This module finds those compilation
+steps in Lecture1 ... Lecture8, orders them by their dependencies and runs
+the independent ones in parallel, rebuilding only outputs that are missing
+or older than their inputs, like make:
+
+    python3 -m compmorph.build           # build everything that is stale
+    python3 -m compmorph.build -n        # only show what would be built
+    python3 -m compmorph.build -j 4 -B   # rebuild everything with 4 processes
+
+The steps are
+
+    X.lexc            -> X.lexc.hfst
+    X.twolc           -> X.twolc.hfst (all rules of the file)
+    X.lexc + X.twolc  -> X_generator.hfst, the lexicon composed with the
+                         intersection of the rules (as in Lecture 6)
+    X.xfst            -> the files it writes with `save stack` or `save
+                         defined`, e.g. en_adjectives.xfst.hfst; it also
+                         depends on the files it reads, e.g.
+                         `read lexc en_adjectives.lexc`
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import hfst_dev
+from hfst_dev import HfstTransducer
+
+from compmorph.compile_cache import read_transducers, write_transducers, \
+    xfst_dependencies, xfst_outputs
+from compmorph.twolc import compose_intersect
+
+# One compilation. inputs and outputs are file names relative to
+# directory; the step must be run after the steps named in requires.
+BuildStep = namedtuple('BuildStep', ['name', 'kind', 'directory', 'inputs',
+                                     'outputs', 'requires'])
+
+
+def _xfst_step(directory, name):
+    with open(os.path.join(directory, name), encoding='utf-8') as f:
+        text = f.read()
+    outputs = xfst_outputs(text)
+    if not outputs:
+        return None
+    inputs = [name] + [dependency for dependency in xfst_dependencies(text)
+                       if dependency not in outputs]
+    return BuildStep(os.path.join(directory, name), 'xfst', directory, inputs,
+                     outputs, [])
+
+
+def find_steps(root='.'):
+    """Return the build steps of the lecture directories under *root*."""
+    steps = []
+    for directory in sorted(glob.glob(os.path.join(root, 'Lecture*'))):
+        if not os.path.isdir(directory):
+            continue
+        names = sorted(os.listdir(directory))
+        for name in names:
+            stem, extension = os.path.splitext(name)
+            if extension in ('.lexc', '.twolc'):
+                steps.append(BuildStep(os.path.join(directory, name),
+                                       extension[1:], directory, [name],
+                                       [name + '.hfst'], []))
+            elif extension == '.xfst':
+                step = _xfst_step(directory, name)
+                if step is not None:
+                    steps.append(step)
+        for name in names:
+            stem, extension = os.path.splitext(name)
+            if extension == '.lexc' and stem + '.twolc' in names:
+                steps.append(BuildStep(
+                    os.path.join(directory, stem + '_generator.hfst'),
+                    'generator', directory,
+                    [name + '.hfst', stem + '.twolc.hfst'],
+                    [stem + '_generator.hfst'], []))
+    return _link(steps)
+
+
+def _link(steps):
+    # A step requires the steps that produce any of its inputs.
+    producers = {}
+    for step in steps:
+        for output in step.outputs:
+            producers[os.path.join(step.directory, output)] = step.name
+    linked = []
+    for step in steps:
+        requires = sorted({producers[os.path.join(step.directory, input)]
+                           for input in step.inputs
+                           if os.path.join(step.directory, input) in producers}
+                          - {step.name})
+        linked.append(step._replace(requires=requires))
+    return linked
+
+
+def is_stale(step):
+    """Return whether an output of *step* is missing or older than an input."""
+    outputs = [os.path.join(step.directory, output) for output in step.outputs]
+    if not all(os.path.exists(output) for output in outputs):
+        return True
+    oldest_output = min(os.path.getmtime(output) for output in outputs)
+    for input in step.inputs:
+        path = os.path.join(step.directory, input)
+        if os.path.exists(path) and os.path.getmtime(path) > oldest_output:
+            return True
+    return False
+
+
+def run_step(step):
+    """Run *step* in its directory. Return the name of the step."""
+    previous = os.getcwd()
+    os.chdir(step.directory)
+    try:
+        if step.kind == 'xfst':
+            started = time.time()
+            status = hfst_dev.compile_xfst_file(step.inputs[0])
+            if status:
+                raise RuntimeError('%s failed with status %s'
+                                   % (step.inputs[0], status))
+            # An older output left in place does not count as written.
+            missing = [output for output in step.outputs
+                       if not os.path.exists(output) or
+                       os.path.getmtime(output) < started - 1]
+            if missing:
+                raise RuntimeError('%s did not write %s'
+                                   % (step.inputs[0], ', '.join(missing)))
+        elif step.kind == 'lexc':
+            hfst_dev.compile_lexc_file(step.inputs[0]).write_to_file(
+                step.outputs[0])
+        elif step.kind == 'twolc':
+            write_transducers(list(hfst_dev.compile_twolc_file(step.inputs[0])),
+                              step.outputs[0])
+        elif step.kind == 'generator':
+            lexicon = HfstTransducer.read_from_file(step.inputs[0])
+            rules = read_transducers(step.inputs[1])
+            generator = compose_intersect(lexicon, rules)
+            generator.minimize()
+            generator.write_to_file(step.outputs[0])
+        else:
+            raise ValueError('unknown kind of step: %s' % step.kind)
+    finally:
+        os.chdir(previous)
+    return step.name
+
+
+def build(steps, processes=None, force=False, dry_run=False, log=print):
+    """Run the stale steps of *steps* in dependency order.
+
+    A step is run if it is stale, if *force* is true, or if a step it
+    requires is run. Independent steps are run in parallel in a pool of
+    *processes* processes. Return the names of the steps that were (or,
+    with *dry_run*, would have been) run. A failing step stops the build.
+    """
+    by_name = {step.name: step for step in steps}
+    to_run = set()
+    # Steps are visited after the steps they require, so that staleness
+    # propagates to everything downstream.
+    for step in _ordered(steps):
+        if force or is_stale(step) or any(name in to_run
+                                          for name in step.requires):
+            to_run.add(step.name)
+    ordered = [step.name for step in _ordered(steps) if step.name in to_run]
+    if dry_run:
+        for name in ordered:
+            log(name)
+        return ordered
+    done = set()
+    running = {}
+    with ProcessPoolExecutor(processes) as pool:
+        while len(done) < len(ordered):
+            for name in ordered:
+                if name in done or name in running.values():
+                    continue
+                if all(required in done or required not in to_run
+                       for required in by_name[name].requires):
+                    running[pool.submit(run_step, by_name[name])] = name
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                future.result()
+                log('built ' + name)
+                done.add(name)
+    return ordered
+
+
+def _ordered(steps):
+    # Topological order that keeps the original order where possible.
+    by_name = {step.name: step for step in steps}
+    ordered = []
+    visiting = set()
+    visited = set()
+
+    def visit(step):
+        if step.name in visited:
+            return
+        if step.name in visiting:
+            raise ValueError('dependency cycle at %s' % step.name)
+        visiting.add(step.name)
+        for name in step.requires:
+            visit(by_name[name])
+        visiting.discard(step.name)
+        visited.add(step.name)
+        ordered.append(step)
+
+    for step in steps:
+        visit(step)
+    return ordered
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compile the lexc, twolc and xfst files of the lectures.')
+    parser.add_argument('root', nargs='?', default='.',
+                        help='directory containing Lecture1 ... Lecture8')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='number of parallel processes')
+    parser.add_argument('-B', '--force', action='store_true',
+                        help='rebuild everything')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help='only print the steps that would be run')
+    args = parser.parse_args(argv)
+    steps = find_steps(args.root)
+    try:
+        build(steps, args.processes, args.force, args.dry_run)
+    except Exception as e:
+        sys.exit('build failed: %s' % e)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""Bulk analysis of word lists.
+
+Assignment 5.1 runs a whole vocabulary through an analyzer with
+
+    for line in some_text_file:
+        some_analyzer.lookup(line)
+
+This module does the same in chunks: newlines are stripped, every distinct
+form of a chunk is looked up only once, the analyzer is converted to the
+optimized lookup format once (see Assignment 1.1) and the results are
+yielded lazily together with throughput statistics.
+"""
+
+import time
+from collections import namedtuple
+
+from hfst_dev import HfstTransducer, ImplementationType
+
+# One looked-up form: the word, the tuple returned by HfstTransducer.lookup
+# (pairs of output string and weight) and how many times the word occurred
+# in its chunk.
+Analysis = namedtuple('Analysis', ['word', 'analyses', 'count'])
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class BulkStats:
+    """Counters updated while a bulk analysis is running."""
+
+    def __init__(self):
+        self.words = 0
+        self.lookups = 0
+        self.chunks = 0
+        self.seconds = 0.0
+
+    @property
+    def words_per_second(self):
+        if self.seconds == 0.0:
+            return 0.0
+        return self.words / self.seconds
+
+    def as_dict(self):
+        return {'words': self.words, 'lookups': self.lookups,
+                'chunks': self.chunks, 'seconds': self.seconds,
+                'words_per_second': self.words_per_second}
+
+    def __str__(self):
+        return '%i words (%i lookups) in %.3f s, %.0f words/s' % \
+            (self.words, self.lookups, self.seconds, self.words_per_second)
+
+
+def read_words(source, encoding='utf-8'):
+    """Yield the words of *source* one by one.
+
+    *source* is either a path to a file with one word per line, an open
+    file or any iterable of strings. Trailing newlines and surrounding
+    whitespace are removed and empty lines are skipped.
+    """
+    if isinstance(source, str):
+        with open(source, 'r', encoding=encoding) as f:
+            yield from read_words(f)
+        return
+    for line in source:
+        word = line.strip()
+        if word:
+            yield word
+
+
+def chunked(words, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Group the iterable *words* into lists of at most *chunk_size* items."""
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be positive')
+    chunk = []
+    for word in words:
+        chunk.append(word)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def optimized_for_lookup(analyzer):
+    """Return *analyzer* in optimized lookup format.
+
+    If *analyzer* is already optimized, it is returned as such. Otherwise
+    an optimized copy is returned and *analyzer* is left untouched.
+    """
+    if analyzer.get_type() in (ImplementationType.HFST_OL_TYPE,
+                               ImplementationType.HFST_OLW_TYPE):
+        return analyzer
+    optimized = HfstTransducer(analyzer)
+    optimized.lookup_optimize()
+    return optimized
+
+
+def analyze_chunk(analyzer, chunk, **kwargs):
+    """Look up the distinct words of *chunk* with *analyzer*.
+
+    Return a list of Analysis objects in the order in which the words first
+    occur in *chunk*. Keyword arguments are passed to HfstTransducer.lookup.
+    """
+    counts = {}
+    for word in chunk:
+        counts[word] = counts.get(word, 0) + 1
+    return [Analysis(word, analyzer.lookup(word, **kwargs), count)
+            for word, count in counts.items()]
+
+
+def analyze_batched(analyzer, source, chunk_size=DEFAULT_CHUNK_SIZE,
+                    optimize=True, stats=None, **kwargs):
+    """Analyze all words of *source* and yield the results chunk by chunk.
+
+    *source* is handled as in read_words. For each chunk of *chunk_size*
+    words a list of Analysis objects is yielded, see analyze_chunk. If
+    *optimize* is true, lookup is done on an optimized copy of *analyzer*.
+    If a BulkStats object is given as *stats*, it is updated after each
+    chunk. Other keyword arguments are passed to HfstTransducer.lookup.
+
+        stats = BulkStats()
+        for chunk in analyze_batched(analyzer, 'finnish-words.txt', stats=stats):
+            for word, analyses, count in chunk:
+                ...
+        print(stats)
+    """
+    if optimize:
+        analyzer = optimized_for_lookup(analyzer)
+    for chunk in chunked(read_words(source), chunk_size):
+        start = time.perf_counter()
+        results = analyze_chunk(analyzer, chunk, **kwargs)
+        if stats is not None:
+            stats.seconds += time.perf_counter() - start
+            stats.words += len(chunk)
+            stats.lookups += len(results)
+            stats.chunks += 1
+        yield results
+
+
+def analyze_file(analyzer, source, **kwargs):
+    """Analyze all words of *source* and return them as a list of Analysis.
+
+    This is a convenience wrapper around analyze_batched for inputs that
+    fit in memory.
+    """
+    results = []
+    for chunk in analyze_batched(analyzer, source, **kwargs):
+        results.extend(chunk)
+    return results
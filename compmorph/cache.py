@@ -0,0 +1,145 @@
+"""A bounded LRU cache in front of HfstTransducer.lookup.
+
+Word frequencies in real text follow Zipf's law, so a small number of forms
+such as "the", "ja" and "och" make up a large part of all tokens. LookupCache
+remembers the results of the most recently used inputs and walks the
+transducer only for the others.
+
+    from compmorph.cache import LookupCache
+    cached = LookupCache(analyzer, max_entries=50000)
+    print(cached.lookup('skies'))
+    print(cached.stats())
+
+A LookupCache can be given to compmorph.bulk.analyze_batched in place of an
+analyzer when called with optimize=False; optimize the wrapped transducer
+with lookup_optimize first.
+
+LookupCache keeps its own copy of the transducer, so changing the original
+in place, e.g. with invert() or minimize(), does not make the cached
+results wrong. To look up in the changed transducer, assign it to the
+attribute *transducer*; this copies it again and empties the cache.
+"""
+
+import sys
+from collections import OrderedDict
+
+from hfst_dev import HfstTransducer
+
+
+def _result_size(key, result):
+    # An estimate of the memory taken by one cache entry.
+    size = sys.getsizeof(key) + sys.getsizeof(result)
+    for item in result:
+        size += sys.getsizeof(item)
+        if isinstance(item, tuple):
+            size += sum(sys.getsizeof(part) for part in item)
+    return size
+
+
+def _key(input, kwargs):
+    return (input, tuple(sorted(kwargs.items()))) if kwargs else input
+
+
+class LookupCache:
+    """Cache the results of lookup() on *transducer*.
+
+    At most *max_entries* results are kept, and if *max_bytes* is given,
+    their estimated size stays below *max_bytes*. When either limit is
+    exceeded, the least recently used results are evicted. If
+    *cache_empty* is false, inputs with no result (out-of-vocabulary
+    forms) are not cached.
+
+    The results are the same objects that HfstTransducer.lookup returned
+    for the first call. The cache looks up in a copy of *transducer*.
+    Assigning a transducer to the attribute *transducer* copies it and
+    empties the cache; reading the attribute returns another copy.
+    """
+
+    def __init__(self, transducer, max_entries=100000, max_bytes=None,
+                 cache_empty=True):
+        if max_entries < 1:
+            raise ValueError('max_entries must be positive')
+        if max_bytes is not None and max_bytes < 1:
+            raise ValueError('max_bytes must be positive')
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.cache_empty = cache_empty
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._transducer = HfstTransducer(transducer)
+
+    @property
+    def transducer(self):
+        return HfstTransducer(self._transducer)
+
+    @transducer.setter
+    def transducer(self, transducer):
+        self._transducer = HfstTransducer(transducer)
+        self.invalidate()
+
+    def invalidate(self):
+        """Remove all cached results. The counters are not reset."""
+        self._entries.clear()
+        self._bytes = 0
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, input, **kwargs):
+        """Return the same as self.transducer.lookup(input, **kwargs)."""
+        key = _key(input, kwargs)
+        entries = self._entries
+        entry = entries.get(key)
+        if entry is not None:
+            entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        result = self._transducer.lookup(input, **kwargs)
+        if result or self.cache_empty:
+            size = _result_size(key, result)
+            entries[key] = (result, size)
+            self._bytes += size
+            self._evict()
+        return result
+
+    def _evict(self):
+        entries = self._entries
+        while len(entries) > self.max_entries or \
+                (self.max_bytes is not None and self._bytes > self.max_bytes
+                 and entries):
+            _, (_, size) = entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, input):
+        """Return whether the result for *input* is cached.
+
+        *input* is a string, or a pair (input, kwargs) for results of
+        lookup(input, **kwargs).
+        """
+        if isinstance(input, tuple):
+            input, kwargs = input
+            return _key(input, kwargs) in self._entries
+        return input in self._entries
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / total
+
+    def stats(self):
+        """Return the counters and the current size of the cache as a dict."""
+        return {'entries': len(self._entries), 'bytes': self._bytes,
+                'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'hit_rate': self.hit_rate}
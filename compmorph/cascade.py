@@ -0,0 +1,210 @@
+"""Composition of rule cascades in a chosen order.
+
+Lecture 2 composes a lexicon with a cascade of replace rules from left to
+right:
+
+    cascade = compose((lexicon, InsertE, YToI, CleanUp))
+
+and Lecture 5 composes Rule1 .o. Rule2 .o. ... .o. Rule16. The order of the
+rules matters (Lecture 2, section 3.5), but since composition is
+associative, the bracketing does not: ((lexicon .o. InsertE) .o. YToI) is
+the same relation as lexicon .o. (InsertE .o. YToI). compose_cascade keeps
+the order of the transducers and only chooses the bracketing:
+
+    left         (((t1 .o. t2) .o. t3) .o. t4), as compose() does
+    rules-first  t1 .o. ((t2 .o. t3) .o. t4), i.e. the rules are composed
+                 with each other before they meet the lexicon
+    greedy       always compose the neighbouring pair with the smallest
+                 product of state counts
+
+Intermediate results with more than *minimize_threshold* states are
+minimized, and the size of every intermediate result is recorded.
+
+    from compmorph.cascade import compose_cascade
+    steps = []
+    cascade = compose_cascade((lexicon, InsertE, YToI, CleanUp),
+                              strategy='rules-first', steps=steps)
+    for step in steps:
+        print(step)
+
+LazyCascade does not compose anything. It keeps the transducers apart and
+looks up an input in the first one, the results of that in the second one
+and so on, remembering the results of every stage. It can answer queries
+right away, while a precomposed cascade answers each query faster once it
+has been built; lookup_crossover measures after how many queries the
+precomposition pays off.
+"""
+
+import time
+from collections import namedtuple
+
+from hfst_dev import HfstTransducer
+
+from compmorph.bulk import optimized_for_lookup
+from compmorph.cache import LookupCache
+
+STRATEGIES = ('left', 'rules-first', 'greedy')
+
+DEFAULT_MINIMIZE_THRESHOLD = 1000
+
+# One composition: the names of the operands, the size of the result
+# after the optional minimization, and the time it took.
+CompositionStep = namedtuple('CompositionStep',
+                             ['left', 'right', 'states', 'arcs', 'minimized',
+                              'seconds'])
+
+
+def _compose_pair(left, right, minimize_threshold):
+    # left = (name, transducer); the transducer of left is modified.
+    start = time.perf_counter()
+    name, result = left
+    result.compose(right[1])
+    minimized = result.number_of_states() > minimize_threshold
+    if minimized:
+        result.minimize()
+    step = CompositionStep(name, right[0], result.number_of_states(),
+                           result.number_of_arcs(), minimized,
+                           time.perf_counter() - start)
+    return ('(%s .o. %s)' % (name, right[0]), result), step
+
+
+def _compose_range(items, strategy, minimize_threshold, steps):
+    while len(items) > 1:
+        if strategy == 'left':
+            index = 0
+        else:
+            index = min(range(len(items) - 1),
+                        key=lambda i: items[i][1].number_of_states() *
+                        items[i + 1][1].number_of_states())
+        item, step = _compose_pair(items[index], items[index + 1],
+                                   minimize_threshold)
+        items[index:index + 2] = [item]
+        steps.append(step)
+    return items[0]
+
+
+def compose_cascade(transducers, strategy='greedy',
+                    minimize_threshold=DEFAULT_MINIMIZE_THRESHOLD,
+                    names=None, steps=None):
+    """Return the composition of *transducers* in the given order.
+
+    The result is equivalent to hfst_dev.compose(transducers) whatever
+    *strategy* (see STRATEGIES) is used. *names* are used in the recorded
+    steps and default to t1, t2, ... If a list is given as *steps*, a
+    CompositionStep is appended to it for each composition. *transducers*
+    are not modified.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError('unknown strategy: %s' % strategy)
+    transducers = list(transducers)
+    if not transducers:
+        raise ValueError('no transducers to compose')
+    if names is None:
+        names = ['t%i' % (index + 1) for index in range(len(transducers))]
+    elif len(names) != len(transducers):
+        raise ValueError('names and transducers differ in length')
+    if steps is None:
+        steps = []
+    items = [(name, HfstTransducer(transducer))
+             for name, transducer in zip(names, transducers)]
+    if strategy == 'rules-first':
+        # Compose the rules left to right, then the lexicon with the result.
+        items = [items[0]] + [_compose_range(items[1:], 'left',
+                                             minimize_threshold, steps)] \
+            if len(items) > 1 else items
+        strategy = 'left'
+    return _compose_range(items, strategy, minimize_threshold, steps)[1]
+
+
+def peak_states(steps):
+    """Return the largest intermediate state count of *steps*."""
+    return max((step.states for step in steps), default=0)
+
+
+class LazyCascade:
+    """Look up inputs through a cascade of transducers without composing them.
+
+    The output strings of each stage are looked up in the next stage and
+    the weights along the way are added. If the same output is reached in
+    several ways, only its smallest weight is kept. The results of each
+    stage are memoized in a compmorph.cache.LookupCache of *cache_size*
+    entries. If *optimize* is true, each stage is converted to optimized
+    lookup format first (only do this if the stages have no identity or
+    unknown symbols that the optimized format cannot handle).
+
+    lookup() returns the same set of (output, weight) pairs as lookup() on
+    compose(transducers), as long as the intermediate strings are split into
+    symbols in the same way by the next stage, sorted by weight and output.
+    """
+
+    def __init__(self, transducers, cache_size=100000, optimize=False):
+        transducers = list(transducers)
+        if not transducers:
+            raise ValueError('no transducers in the cascade')
+        if optimize:
+            transducers = [optimized_for_lookup(t) for t in transducers]
+        self.stages = [LookupCache(t, max_entries=cache_size)
+                       for t in transducers]
+
+    def lookup(self, input):
+        current = {input: 0.0}
+        for stage in self.stages:
+            following = {}
+            for string, weight in current.items():
+                for output, output_weight in stage.lookup(string):
+                    total = weight + output_weight
+                    if total < following.get(output, float('inf')):
+                        following[output] = total
+            if not following:
+                return ()
+            current = following
+        return tuple(sorted(current.items(), key=lambda item: (item[1], item[0])))
+
+    def stats(self):
+        """Return the cache counters of each stage as a list of dicts."""
+        return [stage.stats() for stage in self.stages]
+
+
+def lookup_crossover(transducers, inputs, **kwargs):
+    """Measure when precomposing *transducers* pays off for *inputs*.
+
+    The cascade is built both as a LazyCascade and by composing it with
+    compose_cascade (keyword arguments are passed on) followed by
+    minimization and lookup_optimize. All *inputs* are then looked up with
+    both. Return a dict with the build times, the average time per query
+    of each, and the number of queries after which the precomposed cascade
+    has used less time in total, or None if that never happens.
+    """
+    inputs = list(inputs)
+    start = time.perf_counter()
+    lazy = LazyCascade(transducers)
+    lazy_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    composed = compose_cascade(transducers, **kwargs)
+    composed.minimize()
+    composed.lookup_optimize()
+    composed_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for input in inputs:
+        lazy.lookup(input)
+    lazy_query = (time.perf_counter() - start) / max(len(inputs), 1)
+
+    start = time.perf_counter()
+    for input in inputs:
+        composed.lookup(input)
+    composed_query = (time.perf_counter() - start) / max(len(inputs), 1)
+
+    if lazy_query > composed_query:
+        crossover = int((composed_build - lazy_build) /
+                        (lazy_query - composed_query)) + 1
+        crossover = max(crossover, 0)
+    else:
+        crossover = None
+    return {'inputs': len(inputs),
+            'lazy_build_seconds': lazy_build,
+            'composed_build_seconds': composed_build,
+            'lazy_query_seconds': lazy_query,
+            'composed_query_seconds': composed_query,
+            'crossover_queries': crossover}
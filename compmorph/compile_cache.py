@@ -0,0 +1,239 @@
+"""A persistent cache for compiled lexc, twolc and xfst files.
+
+The lectures compile their grammars again on every run, e.g.
+compile_lexc_file('en_adjectives.lexc') or compile_xfst_file('malay.xfst').
+CompileCache stores the results on disk under a key computed from
+
+  - the text of the source file,
+  - the compiler options,
+  - the hfst_dev version, and
+  - the text of the files that the source reads, such as the
+    `read lexc malay.lexc` line of malay.xfst, recursively.
+
+If nothing has changed, the stored result is returned without compiling.
+Editing an included file changes the keys of exactly those sources that
+read it.
+
+    from compmorph.compile_cache import CompileCache
+    cache = CompileCache()
+    lexicon = cache.compile_lexc_file('en_adjectives.lexc')
+    rules = cache.compile_twolc_file('en_adjectives.twolc')
+    cache.compile_xfst_file('en_adjectives.xfst')  # writes en_adjectives.xfst.hfst
+
+An xfst script is cached through the files that it writes with
+`save stack` and `save defined`. On a cache hit these files are restored
+and the commands of the script are not run, so output that the script
+would print (e.g. from `apply up`) is not shown.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import hfst_dev
+from hfst_dev import HfstInputStream, HfstOutputStream
+
+# xfst imports this module in turn, see there.
+from compmorph import xfst
+
+DEFAULT_DIRECTORY = os.path.join('~', '.cache', 'compmorph')
+
+# Options that do not change the result of a compilation.
+_IGNORED_OPTIONS = ('verbosity',)
+
+# xfst commands that read another file, and the commands that write one.
+# The file name may follow a < or > sign; `read regex` reads a file only
+# with <, otherwise the regex is in the script itself.
+_XFST_READ = re.compile(
+    r'^[ \t]*(?:read[ \t]+(?:(?:lexc|att|prolog|text|spaced-text)[ \t]*<?|'
+    r'regex[ \t]*<)|load(?:[ \t]+(?:stack|defined))?[ \t]*<?|source)'
+    r'[ \t]*([^\s<>;]+)', re.MULTILINE)
+_XFST_SAVE_STACK = re.compile(
+    r'^[ \t]*save(?:[ \t]+stack)?[ \t]*>?[ \t]*(?!defined\b)([^\s<>;]+)',
+    re.MULTILINE)
+_XFST_SAVE_DEFINED = re.compile(
+    r'^[ \t]*save[ \t]+defined[ \t]*>?[ \t]*([^\s<>;]+)', re.MULTILINE)
+
+
+def _strip_xfst_comments(text):
+    return '\n'.join(xfst.strip_comment(line) for line in text.splitlines())
+
+
+def xfst_dependencies(text):
+    """Return the files read by the xfst script *text*, in order."""
+    return _XFST_READ.findall(_strip_xfst_comments(text))
+
+
+def xfst_outputs(text):
+    """Return the files written by the xfst script *text*, in order.
+
+    These are the files of `save stack` (or `save`) and of `save defined`.
+    """
+    text = _strip_xfst_comments(text)
+    matches = [(match.start(), match.group(1))
+               for pattern in (_XFST_SAVE_STACK, _XFST_SAVE_DEFINED)
+               for match in pattern.finditer(text)]
+    return [path for _, path in sorted(matches)]
+
+
+def _read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def write_transducers(transducers, path):
+    """Write *transducers* to the file *path* as one HFST stream."""
+    ostr = HfstOutputStream(filename=path, type=transducers[0].get_type())
+    for transducer in transducers:
+        ostr.write(transducer)
+    ostr.flush()
+    ostr.close()
+
+
+def read_transducers(path):
+    """Return a list of all transducers in the HFST file *path*."""
+    istr = HfstInputStream(path)
+    transducers = []
+    while not istr.is_eof():
+        transducers.append(istr.read())
+    istr.close()
+    return transducers
+
+
+class CompileCache:
+    """Compile grammar files through an on-disk cache in *directory*."""
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = os.environ.get('COMPMORPH_CACHE', DEFAULT_DIRECTORY)
+        self.directory = os.path.expanduser(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, kind, path, options):
+        """Return the cache key for compiling *path* as *kind* with *options*."""
+        digest = hashlib.sha256()
+        digest.update(('%s\0%s\0' % (kind, hfst_dev.__version__)).encode('utf-8'))
+        relevant = sorted((name, repr(value)) for name, value in options.items()
+                          if name not in _IGNORED_OPTIONS)
+        digest.update(repr(relevant).encode('utf-8'))
+        self._hash_source(digest, kind, path, set())
+        return digest.hexdigest()
+
+    def _hash_source(self, digest, kind, path, seen):
+        data = _read_bytes(path)
+        digest.update(b'%d\0' % len(data))
+        digest.update(data)
+        if kind != 'xfst':
+            return
+        for dependency in xfst_dependencies(data.decode('utf-8')):
+            digest.update(dependency.encode('utf-8') + b'\0')
+            if dependency in seen or not os.path.exists(dependency):
+                digest.update(b'-\0')
+                continue
+            seen.add(dependency)
+            dependency_kind = 'xfst' if dependency.endswith('.xfst') else 'data'
+            self._hash_source(digest, dependency_kind, dependency, seen)
+
+    def _entry(self, key):
+        return os.path.join(self.directory, key)
+
+    def _store(self, key, manifest, files):
+        # Write into a temporary directory first, so that an interrupted
+        # compilation never leaves a partial entry behind.
+        temporary = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+        try:
+            for name, source in files:
+                shutil.copyfile(source, os.path.join(temporary, name))
+            with open(os.path.join(temporary, 'manifest.json'), 'w') as f:
+                json.dump(manifest, f)
+            os.replace(temporary, self._entry(key))
+        except OSError:
+            shutil.rmtree(temporary, ignore_errors=True)
+            if not os.path.isdir(self._entry(key)):
+                raise
+
+    def _load_manifest(self, key):
+        try:
+            with open(os.path.join(self._entry(key), 'manifest.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _compile_transducers(self, kind, compile, path, options):
+        key = self.key(kind, path, options)
+        manifest = self._load_manifest(key)
+        if manifest is not None:
+            self.hits += 1
+            transducers = read_transducers(
+                os.path.join(self._entry(key), 'result.hfst'))
+            return transducers if manifest['list'] else transducers[0]
+        self.misses += 1
+        result = compile(path, **options)
+        if result is None:
+            return result
+        is_list = not isinstance(result, hfst_dev.HfstTransducer)
+        transducers = list(result) if is_list else [result]
+        if transducers:
+            temporary = os.path.join(self.directory, '.result-%s.hfst' % key)
+            write_transducers(transducers, temporary)
+            try:
+                self._store(key, {'kind': kind, 'source': path, 'list': is_list},
+                            [('result.hfst', temporary)])
+            finally:
+                os.remove(temporary)
+        return result
+
+    def compile_lexc_file(self, path, **options):
+        """Like hfst_dev.compile_lexc_file, through the cache."""
+        return self._compile_transducers('lexc', hfst_dev.compile_lexc_file,
+                                         path, options)
+
+    def compile_twolc_file(self, path, **options):
+        """Like hfst_dev.compile_twolc_file, through the cache."""
+        return self._compile_transducers('twolc', hfst_dev.compile_twolc_file,
+                                         path, options)
+
+    def compile_xfst_file(self, path, **options):
+        """Like hfst_dev.compile_xfst_file, through the cache.
+
+        The files written by `save stack` and `save defined` are restored
+        from the cache if the script or anything it reads has not changed.
+        """
+        key = self.key('xfst', path, options)
+        manifest = self._load_manifest(key)
+        if manifest is not None:
+            self.hits += 1
+            for index, output in enumerate(manifest['outputs']):
+                shutil.copyfile(os.path.join(self._entry(key), str(index)),
+                                output)
+            return manifest['result']
+        self.misses += 1
+        start = time.time()
+        result = hfst_dev.compile_xfst_file(path, **options)
+        with open(path, encoding='utf-8') as f:
+            outputs = xfst_outputs(f.read())
+        # Store the entry only if the script succeeded and wrote all its
+        # outputs anew.
+        if result == 0 and outputs and all(os.path.exists(output) and
+                           os.path.getmtime(output) >= start - 1
+                           for output in outputs):
+            self._store(key, {'kind': 'xfst', 'source': path, 'result': result,
+                              'outputs': outputs},
+                        [(str(index), output)
+                         for index, output in enumerate(outputs)])
+        return result
+
+    def clear(self):
+        """Remove all entries of the cache."""
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            if os.path.isdir(entry):
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                os.remove(entry)
@@ -0,0 +1,181 @@
+"""Weighted error transducers from keyboard confusion tables.
+
+Section 4.2 of Lecture 3 gives the probabilities of the keys pressed when
+F was intended, P(p = D | i = F) = 0.1 and so on, and turns them into a
+chain of optional replace rules, one composition per pair:
+
+    [ f (->) d::1.000 ] .o. [ f (->) g::1.000 ] .o. [ f (->) r::1.602 ] ...
+
+confusion_transducer builds the whole table into a transducer with one
+state and one arc per (intended, pressed) pair instead. As in section 5 of
+Lecture 3, the weight of a pair is its logprob, -log10 P(pressed |
+intended); keys that are not in the table are copied with weight 0:
+
+    from compmorph.confusion import confusion_transducer, read_table
+    errors = confusion_transducer(read_table('keyboard.csv'))
+    spellchecker = hfst_dev.compose((vocabulary, errors))
+    spellchecker.invert()
+
+A table is a CSV file with the columns intended, pressed, probability (a
+header line is allowed), or a dict mapping (intended, pressed) pairs, or
+intended keys to dicts of pressed keys, to probabilities:
+
+    f,f,0.7
+    f,d,0.1
+    f,g,0.1
+
+The rule chain of Lecture 3 can be built with rule_chain for comparison;
+`python3 -m compmorph.confusion keyboard.csv --compare words.txt` prints
+the build times and the sizes of the models and of the noisy vocabularies.
+"""
+
+import argparse
+import csv
+import json
+import math
+import time
+
+from hfst_dev import HfstIterableTransducer, HfstTransducer, compose, fst, \
+    regex
+
+from compmorph.symbols import IDENTITY, quote
+
+
+def logprob(probability):
+    """Return -log10 *probability*, the weight of Lecture 3 section 5."""
+    if not 0 < probability <= 1:
+        raise ValueError('not a probability: %r' % probability)
+    return -math.log10(probability) + 0.0
+
+
+def read_table(path, encoding='utf-8'):
+    """Read a confusion table from the CSV file *path*.
+
+    Return a dict mapping (intended, pressed) pairs to probabilities.
+    Blank lines, lines starting with # and a header line are skipped.
+    """
+    table = {}
+    with open(path, encoding=encoding, newline='') as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith('#'):
+                continue
+            if len(row) != 3:
+                raise ValueError('%s: expected 3 columns: %r' % (path, row))
+            try:
+                probability = float(row[2])
+            except ValueError:
+                if table:
+                    raise
+                continue
+            table[(row[0].strip(), row[1].strip())] = probability
+    return table
+
+
+def _pairs(table):
+    # Return the table as a dict of (intended, pressed) pairs.
+    pairs = {}
+    for key, value in table.items():
+        if isinstance(value, dict):
+            for pressed, probability in value.items():
+                pairs[(key, pressed)] = probability
+        else:
+            pairs[key] = value
+    return pairs
+
+
+def confusion_weights(table):
+    """Return the weights (logprobs) of *table* as a dict of pairs."""
+    return {pair: logprob(probability)
+            for pair, probability in _pairs(table).items()}
+
+
+def confusion_transducer(table, copy_unknown=True):
+    """Return the single-state error transducer of the confusion *table*.
+
+    Each (intended, pressed) pair is an arc from intended to pressed
+    weighted with its logprob. If *copy_unknown* is true, symbols that are
+    not among the intended keys of the table are copied with weight 0.
+    """
+    weights = confusion_weights(table)
+    fsm = HfstIterableTransducer()
+    fsm.set_final_weight(0, 0.0)
+    for (intended, pressed), weight in sorted(weights.items()):
+        fsm.add_transition(0, 0, intended, pressed, weight)
+    if copy_unknown:
+        # The identity symbol only matches symbols outside the alphabet of
+        # the transducer, so keys that are only pressed are copied apart.
+        intended_keys = {intended for intended, _ in weights}
+        for pressed in sorted({pressed for _, pressed in weights}
+                              - intended_keys):
+            fsm.add_transition(0, 0, pressed, pressed, 0.0)
+        fsm.add_transition(0, 0, IDENTITY, IDENTITY, 0.0)
+    return HfstTransducer(fsm)
+
+
+def rule_chain(table):
+    """Return the optional replace rules of Lecture 3 for *table*, composed.
+
+    Each pair of different keys becomes [ intended (->) pressed::weight ]
+    and the rules are composed in the order of the table. The chain is not
+    the same relation as confusion_transducer: a later rule may rewrite
+    the output of an earlier one, and keeping a key costs nothing.
+    """
+    rules = [regex('[ %s (->) %s::%r ]' % (quote(intended), quote(pressed),
+                                          weight))
+             for (intended, pressed), weight in confusion_weights(table).items()
+             if intended != pressed]
+    if not rules:
+        return regex('?*')
+    return compose(rules)
+
+
+def compare_with_rule_chain(vocabulary, table):
+    """Build the error model of *table* both ways and compose each with *vocabulary*.
+
+    Return a dict with, for 'transducer' and 'rule_chain', the time to
+    build the model, its numbers of states and arcs, the time to compose
+    it with the vocabulary and the states and arcs of the result.
+    """
+    report = {}
+    for name, build in (('transducer', confusion_transducer),
+                        ('rule_chain', rule_chain)):
+        start = time.perf_counter()
+        model = build(table)
+        build_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        noisy = HfstTransducer(vocabulary)
+        noisy.compose(model)
+        noisy.minimize()
+        compose_seconds = time.perf_counter() - start
+        report[name] = {'build_seconds': build_seconds,
+                        'model_states': model.number_of_states(),
+                        'model_arcs': model.number_of_arcs(),
+                        'compose_seconds': compose_seconds,
+                        'noisy_states': noisy.number_of_states(),
+                        'noisy_arcs': noisy.number_of_arcs()}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compile a keyboard confusion table into a weighted '
+                    'error transducer.')
+    parser.add_argument('table', help='CSV file: intended, pressed, probability')
+    parser.add_argument('-o', '--output', help='write the transducer here')
+    parser.add_argument('--compare', metavar='WORDS',
+                        help='compare with the rule chain of Lecture 3 on '
+                             'the vocabulary in this file, one word per line')
+    args = parser.parse_args(argv)
+    table = read_table(args.table)
+    if args.output:
+        confusion_transducer(table).write_to_file(args.output)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            words = tuple(line.strip() for line in f if line.strip())
+        vocabulary = fst(words)
+        vocabulary.minimize()
+        print(json.dumps(compare_with_rule_chain(vocabulary, table), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""Spelling correction by edit distance, computed at query time.
+
+The spell checker of Lecture 3 composes the vocabulary with an error model,
+Vocabulary .o. Substitution, and inverts the result. With substitutions,
+insertions, deletions and transpositions of every letter (Assignment 3.4)
+the composed NoisyVocabulary gets much larger than the vocabulary.
+EditDistanceCorrector keeps only the vocabulary. For each misspelled word
+it searches the vocabulary and the possible edits of the word together,
+lightest first, so nothing is built but the few paths that are visited:
+
+    from compmorph.correction import EditDistanceCorrector, EditWeights
+    corrector = EditDistanceCorrector(vocabulary, max_distance=2,
+                                      weights=EditWeights(transposition=0.5),
+                                      substitutions={('f', 'd'): 1.0})
+    print(corrector.correct('dight', k=3))
+
+The edits are named after what happened when the word was typed:
+
+    substitution   a letter of the word was typed as another letter
+    insertion      a letter that is not in the word was typed
+    deletion       a letter of the word was not typed
+    transposition  two neighbouring letters of the word were swapped
+
+error_model builds the same edits as a weighted transducer for the
+composed approach, and compare_with_composed measures both.
+"""
+
+import heapq
+import itertools
+import time
+from collections import namedtuple
+
+from hfst_dev import EPSILON, HfstTransducer, regex
+
+from compmorph.nbest import full_lookup
+from compmorph.paths import Graph
+from compmorph.symbols import is_visible, quote, tokenize
+
+# The weight of each kind of edit, see the module documentation.
+EditWeights = namedtuple('EditWeights', ['substitution', 'insertion',
+                                         'deletion', 'transposition'])
+EditWeights.__new__.__defaults__ = (1.0, 1.0, 1.0, 1.0)
+
+DEFAULT_MAX_DISTANCE = 2
+
+
+class EditDistanceCorrector:
+    """Corrections of words into the words of *vocabulary*.
+
+    *vocabulary* is an acceptor of the correctly spelled words, such as
+    the Vocabulary of Lecture 3; of a transducer, the output side is used.
+    A correction may use at most *max_distance* edits, weighted by
+    *weights* (an EditWeights). *substitutions* maps (intended, typed)
+    letter pairs to the weight of that substitution, overriding
+    weights.substitution, e.g. {('f', 'd'): 1.0} for f typed as d. The
+    weight of a correction is the weight of the word in the vocabulary
+    plus the weights of the edits.
+    """
+
+    def __init__(self, vocabulary, max_distance=DEFAULT_MAX_DISTANCE,
+                 weights=EditWeights(), substitutions=None):
+        graph = Graph(vocabulary)
+        self.finals = graph.finals
+        self.max_distance = max_distance
+        self.weights = weights
+        self.substitutions = dict(substitutions or {})
+        # arcs[state] is a list of (symbol, target, weight); symbol is ''
+        # for epsilons and flag diacritics.
+        self.arcs = {}
+        self.alphabet = set()
+        for state, arcs in graph.arcs.items():
+            self.arcs[state] = [(output if is_visible(output, True) else '',
+                                 target, weight)
+                                for _, output, target, weight in arcs]
+            self.alphabet.update(symbol for symbol, _, _ in self.arcs[state]
+                                 if symbol)
+        self._longest = max((len(symbol) for symbol in self.alphabet), default=1)
+
+    def tokenize(self, word):
+        """Split *word* into symbols of the vocabulary, longest match first."""
+        return tokenize(word, self.alphabet, self._longest)
+
+    def _substitution(self, intended, typed):
+        return self.substitutions.get((intended, typed),
+                                      self.weights.substitution)
+
+    def _moves(self, state, tokens, position, edits):
+        # Yield (symbol, target, position, edits, weight) for each way to
+        # continue from state with tokens[position:] left to read.
+        typed = tokens[position] if position < len(tokens) else None
+        can_edit = edits < self.max_distance
+        for symbol, target, weight in self.arcs.get(state, ()):
+            if not symbol:
+                yield '', target, position, edits, weight
+                continue
+            if symbol == typed:
+                yield symbol, target, position + 1, edits, weight
+            elif can_edit and typed is not None:
+                yield (symbol, target, position + 1, edits + 1,
+                       weight + self._substitution(symbol, typed))
+            if can_edit:
+                yield (symbol, target, position, edits + 1,
+                       weight + self.weights.deletion)
+            if can_edit and typed is not None and symbol != typed and \
+                    position + 1 < len(tokens) and \
+                    tokens[position + 1] == symbol:
+                for second, second_target, second_weight in \
+                        self.arcs.get(target, ()):
+                    if second == typed:
+                        yield (symbol + second, second_target, position + 2,
+                               edits + 1,
+                               weight + second_weight +
+                               self.weights.transposition)
+        if can_edit and typed is not None:
+            yield '', state, position + 1, edits + 1, self.weights.insertion
+
+    def correct(self, word, k=5, max_weight=None, time_limit=None,
+                stats=None):
+        """Return the *k* lightest corrections of *word* as (word, weight) pairs.
+
+        A correctly spelled word is its own correction, with no edits. The
+        search stops early when the remaining corrections weigh more than
+        *max_weight* or after *time_limit* seconds. If a dict is given as
+        *stats*, the number of expanded search nodes and the time are
+        stored in it.
+        """
+        start = time.perf_counter()
+        tokens = self.tokenize(word)
+        counter = itertools.count()
+        # A search node is (state, position in tokens, edits, output); a
+        # complete one is pushed again with its final weight added.
+        queue = [(0.0, next(counter), False, (0, 0, 0, ''))]
+        results = []
+        seen = set()
+        settled = set()
+        while queue and len(results) < k:
+            if max_weight is not None and queue[0][0] > max_weight:
+                break
+            if time_limit is not None and \
+                    time.perf_counter() - start > time_limit:
+                break
+            weight, _, complete, node = heapq.heappop(queue)
+            if complete:
+                if node[3] not in seen:
+                    seen.add(node[3])
+                    results.append((node[3], weight))
+                continue
+            if node in settled:
+                continue
+            settled.add(node)
+            state, position, edits, output = node
+            if position == len(tokens) and state in self.finals:
+                heapq.heappush(queue, (weight + self.finals[state],
+                                       next(counter), True, node))
+            for symbol, target, following, following_edits, move_weight in \
+                    self._moves(state, tokens, position, edits):
+                heapq.heappush(queue, (weight + move_weight, next(counter),
+                                       False, (target, following,
+                                               following_edits,
+                                               output + symbol)))
+        if stats is not None:
+            stats.update(expansions=len(settled),
+                         seconds=time.perf_counter() - start)
+        return tuple(results)
+
+
+def error_model(alphabet, max_distance=DEFAULT_MAX_DISTANCE,
+                weights=EditWeights(), substitutions=None):
+    """Return the edits of EditDistanceCorrector as a weighted transducer.
+
+    The transducer maps words over *alphabet* to their misspellings with
+    at most *max_distance* edits, like Substitution in Lecture 3, so that
+    [ Vocabulary .o. error_model(...) ].i is a spell checker.
+    """
+    substitutions = substitutions or {}
+    symbols = sorted(symbol for symbol in alphabet
+                     if is_visible(symbol, True) and not symbol.startswith('@'))
+    edits = []
+    for intended in symbols:
+        for typed in symbols:
+            if intended != typed:
+                edits.append('%s:%s::%r' % (
+                    quote(intended), quote(typed),
+                    substitutions.get((intended, typed),
+                                      weights.substitution)))
+                edits.append('[%s:%s %s:%s]::%r' % (
+                    quote(intended), quote(typed), quote(typed),
+                    quote(intended), weights.transposition))
+        edits.append('0:%s::%r' % (quote(intended), weights.insertion))
+        edits.append('%s:0::%r' % (quote(intended), weights.deletion))
+    identity = '[%s]' % '|'.join(quote(symbol) for symbol in symbols)
+    return regex('[ %s* [ [ %s ] %s* ]^{0,%i} ]'
+                 % (identity, ' | '.join(edits), identity, max_distance))
+
+
+def composed_corrector(vocabulary, **kwargs):
+    """Return the spell checker [ vocabulary .o. error_model ].i, minimized.
+
+    Keyword arguments are passed to error_model.
+    """
+    alphabet = [symbol for symbol in vocabulary.get_alphabet()
+                if symbol != EPSILON]
+    spellchecker = HfstTransducer(vocabulary)
+    spellchecker.compose(error_model(alphabet, **kwargs))
+    spellchecker.invert()
+    spellchecker.minimize()
+    return spellchecker
+
+
+def compare_with_composed(vocabulary, words, k=5, **kwargs):
+    """Compare EditDistanceCorrector with the composed spell checker.
+
+    Both are built from *vocabulary* with the same keyword arguments
+    (max_distance, weights, substitutions) and all *words* are corrected
+    with both. Return a dict with the build times, the number of states
+    of the vocabulary and of the composed spell checker, the average
+    seconds per word of each, and the number of words whose k best
+    weights differ.
+    """
+    words = list(words)
+    start = time.perf_counter()
+    corrector = EditDistanceCorrector(vocabulary, **kwargs)
+    lazy_build = time.perf_counter() - start
+    start = time.perf_counter()
+    spellchecker = composed_corrector(vocabulary, **kwargs)
+    composed_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lazy = [corrector.correct(word, k) for word in words]
+    lazy_query = time.perf_counter() - start
+    start = time.perf_counter()
+    composed = [full_lookup(spellchecker, word, k) for word in words]
+    composed_query = time.perf_counter() - start
+
+    differences = sum(1 for a, b in zip(lazy, composed)
+                      if [round(w, 4) for _, w in a] !=
+                      [round(w, 4) for _, w in b])
+    count = max(len(words), 1)
+    return {'words': len(words),
+            'vocabulary_states': vocabulary.number_of_states(),
+            'composed_states': spellchecker.number_of_states(),
+            'lazy_build_seconds': lazy_build,
+            'composed_build_seconds': composed_build,
+            'lazy_query_seconds': lazy_query / count,
+            'composed_query_seconds': composed_query / count,
+            'differences': differences}
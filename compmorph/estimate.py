@@ -0,0 +1,470 @@
+"""Estimating lexicon weights from a corpus.
+
+Section 5.3 of Lecture 3 writes weights such as
+
+    poika:po^J^Ka        Number "weight: 3.00000" ; ! Probability: 0.001
+
+into the lexc file by hand. This module counts how often each lexeme and
+each tag sequence occurs in the analyses of a corpus and turns the counts
+into logprobs, -log10 of add-alpha smoothed unigram probabilities:
+
+    python3 -m compmorph.estimate analyzer.hfst corpus.txt \\
+        --lexc finnish.lexc -o finnish-weighted.lexc
+    python3 -m compmorph.estimate analyzer.hfst corpus.txt \\
+        --reweight analyzer-weighted.hfst
+
+The corpus is analyzed in shards by a process pool as in
+compmorph.parallel (a line may contain several tokens separated by
+whitespace). Each worker counts its shard and the counts are merged in
+SpillingCounters, which write sorted runs to disk when they get too large,
+so the memory used does not grow with the size of the corpus.
+
+An analysis such as poika#silla+N+Sg+Nom is split at the first tag (a
+symbol starting with *tag_start*, '+' by default) into the lexemes poika
+and silla, separated by the compound boundary '#', and the tag sequence
++N+Sg+Nom. An ambiguous token adds 1/n to the counts of each of its n
+analyses.
+"""
+
+import argparse
+import heapq
+import json
+import math
+import multiprocessing
+import os
+import re
+import tempfile
+from collections import Counter, namedtuple
+
+from hfst_dev import HfstTransducer, fst, regex
+
+from compmorph.bulk import optimized_for_lookup
+from compmorph.lexicon import strip_comments, strip_weight
+from compmorph.parallel import DEFAULT_SHARD_SIZE, shard_lines
+from compmorph.symbols import quote
+from compmorph.wordlists import WordList
+
+DEFAULT_MAX_ENTRIES = 1000000
+
+# The analyzer of a worker process, set by _load_analyzer.
+_analyzer = None
+
+# The result of count_corpus: numbers of tokens and of tokens without
+# analyses, and SpillingCounters of lexemes and of tag sequences (the
+# latter also counts compound boundaries).
+CorpusCounts = namedtuple('CorpusCounts',
+                          ['tokens', 'unknown', 'lexemes', 'tags'])
+
+
+class SpillingCounter:
+    """A counter of strings that keeps at most *max_entries* keys in memory.
+
+    When the limit is reached, the counts are written to a temporary file
+    in *directory* as a sorted run and the memory is cleared. items()
+    merges the runs. Use as a context manager or call close() to remove
+    the files.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, directory=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.counts = Counter()
+        self.runs = []
+        self.total = 0.0
+
+    def add(self, key, count=1.0):
+        self.counts[key] += count
+        self.total += count
+        if len(self.counts) >= self.max_entries:
+            self._spill()
+
+    def update(self, counts):
+        """Add the counts of the mapping *counts*."""
+        for key, count in counts.items():
+            self.add(key, count)
+
+    def _spill(self):
+        descriptor, path = tempfile.mkstemp(suffix='.counts',
+                                            dir=self.directory)
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+            for key in sorted(self.counts):
+                f.write(json.dumps([key, self.counts[key]]) + '\n')
+        self.runs.append(path)
+        self.counts = Counter()
+
+    def _read_run(self, path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                key, count = json.loads(line)
+                yield key, count
+
+    def items(self):
+        """Yield (key, count) pairs in the order of the keys."""
+        runs = [self._read_run(path) for path in self.runs]
+        runs.append(iter(sorted(self.counts.items())))
+        key = None
+        count = 0.0
+        for next_key, next_count in heapq.merge(*runs):
+            if next_key != key:
+                if key is not None:
+                    yield key, count
+                key = next_key
+                count = 0.0
+            count += next_count
+        if key is not None:
+            yield key, count
+
+    def close(self):
+        for path in self.runs:
+            os.remove(path)
+        self.runs = []
+        self.counts = Counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def split_analysis(analysis, tag_start='+', compound_boundary='#'):
+    """Split *analysis* into its lexemes and its tag sequence.
+
+    E.g. 'poika#silla+N+Sg+Nom' gives (['poika', 'silla'], '+N+Sg+Nom').
+    """
+    index = analysis.find(tag_start)
+    if index < 0:
+        index = len(analysis)
+    lexemes = analysis[:index]
+    lexemes = lexemes.split(compound_boundary) if compound_boundary else [lexemes]
+    return [lexeme for lexeme in lexemes if lexeme], analysis[index:]
+
+
+def split_tags(tag_sequence, tag_start='+'):
+    """Split *tag_sequence* into its tags, e.g. '+N+Sg' into ('+N', '+Sg').
+
+    Text before the first tag is left out.
+    """
+    return tuple(tag_start + tag for tag in tag_sequence.split(tag_start)[1:])
+
+
+def _contains_run(tags, run):
+    # Whether the tuple run occurs in the tuple tags as consecutive items.
+    if not run:
+        return False
+    return any(tags[index:index + len(run)] == run
+               for index in range(len(tags) - len(run) + 1))
+
+
+def _load_analyzer(analyzer_path):
+    global _analyzer
+    _analyzer = optimized_for_lookup(
+        HfstTransducer.read_from_file(analyzer_path))
+
+
+def _count_shard(args):
+    path, first_line, last_line, tag_start, compound_boundary, kwargs = args
+    lexemes = Counter()
+    tags = Counter()
+    tokens = 0
+    unknown = 0
+    cache = {}
+    with WordList(path) as lines:
+        for line in lines.lines(first_line, last_line):
+            for token in line.split():
+                tokens += 1
+                if token not in cache:
+                    cache[token] = sorted({analysis for analysis, _ in
+                                           _analyzer.lookup(token, **kwargs)})
+                analyses = cache[token]
+                if not analyses:
+                    unknown += 1
+                    continue
+                share = 1.0 / len(analyses)
+                for analysis in analyses:
+                    parts, tag_sequence = split_analysis(
+                        analysis, tag_start, compound_boundary)
+                    for lexeme in parts:
+                        lexemes[lexeme] += share
+                    if len(parts) > 1:
+                        tags[compound_boundary] += share * (len(parts) - 1)
+                    if tag_sequence:
+                        tags[tag_sequence] += share
+    return tokens, unknown, lexemes, tags
+
+
+def count_corpus(analyzer_path, corpus_path, processes=None,
+                 shard_size=DEFAULT_SHARD_SIZE, max_entries=DEFAULT_MAX_ENTRIES,
+                 directory=None, tag_start='+', compound_boundary='#',
+                 **kwargs):
+    """Count the lexemes and tag sequences of the analyses of a corpus.
+
+    The corpus *corpus_path* is split into shards of *shard_size* lines
+    that are analyzed with the analyzer file *analyzer_path* by
+    *processes* worker processes. The counters keep at most *max_entries*
+    keys in memory and spill to temporary files in *directory*. Other
+    keyword arguments are passed to HfstTransducer.lookup. Return a
+    CorpusCounts; close its counters when done.
+    """
+    tasks = [(corpus_path, first, last, tag_start, compound_boundary, kwargs)
+             for first, last in shard_lines(corpus_path, shard_size)]
+    counts = CorpusCounts(0, 0, SpillingCounter(max_entries, directory),
+                          SpillingCounter(max_entries, directory))
+    tokens = 0
+    unknown = 0
+    with multiprocessing.Pool(processes, initializer=_load_analyzer,
+                              initargs=(analyzer_path,)) as pool:
+        for shard_tokens, shard_unknown, lexemes, tags in \
+                pool.imap_unordered(_count_shard, tasks):
+            tokens += shard_tokens
+            unknown += shard_unknown
+            counts.lexemes.update(lexemes)
+            counts.tags.update(tags)
+    return counts._replace(tokens=tokens, unknown=unknown)
+
+
+def logprob(count, total, types, alpha=1.0):
+    """Return -log10 of the add-*alpha* probability of *count* of *total*.
+
+    *types* is the number of different outcomes, including unseen ones.
+    """
+    return -math.log10((count + alpha) / (total + alpha * types)) + 0.0
+
+
+def _unescape(text):
+    return re.sub(r'%(.)', r'\1', text)
+
+
+def _upper(entry):
+    # The upper side of a lexc entry, e.g. 'poika' for 'poika:po^J^Ka Number'.
+    # Entries with only a continuation, e.g. 'Nouns' or
+    # 'Nouns "weight: 0.30103"', have an empty one.
+    words = strip_weight(entry).split()
+    if len(words) < 2 or words[0].startswith('<'):
+        return ''
+    upper = re.split(r'(?<!%):', words[0])[0]
+    return '' if upper == '0' else _unescape(upper)
+
+
+def _entry_lines(text):
+    # Yield (line, lexicon, entry, rest) for the lines of a lexc file, where
+    # entry is the text before the semicolon of an entry line (None for
+    # other lines) and rest is the text from the semicolon on.
+    lexicon = None
+    ended = False
+    for line in text.splitlines(True):
+        code = strip_comments(line)
+        words = code.split()
+        if words and words[0] == 'LEXICON' and len(words) > 1:
+            lexicon = words[1]
+        elif words and words[0] == 'END':
+            ended = True
+        match = re.search(r'(?<!%);', code)
+        if lexicon is None or ended or match is None:
+            yield line, lexicon, None, None
+        else:
+            yield line, lexicon, line[:match.start()], line[match.start():]
+
+
+def entry_weights(lexc_text, counts, alpha=1.0, tag_start='+',
+                  compound_boundary='#'):
+    """Return the weights of the entries of *lexc_text* as a dict.
+
+    The keys are (lexicon, entry) pairs, with the entry text as in the
+    file. A lexeme entry (its upper side has no tag) gets the logprob of
+    its lexeme among all lexemes of the corpus, counting the lexemes of
+    the lexc file that do not occur. An entry with tags, or the compound
+    boundary, gets the logprob of the tag sequences containing its tags
+    as a contiguous run of whole tags (so +N does not match +Num) among
+    the other such entries of its lexicon. An entry with an empty upper
+    side next to such entries, e.g. the `# ;` of PossWithS, is the
+    alternative of none of them: it gets the count of the tag sequences
+    that match none of its siblings. Other entries with an empty upper
+    side are not weighted.
+    """
+    lexemes = {}
+    tag_entries = {}
+    empty_entries = {}
+    for _, lexicon, entry, _ in _entry_lines(lexc_text):
+        if entry is None:
+            continue
+        upper = _upper(entry)
+        if not upper:
+            empty_entries.setdefault(lexicon, []).append(entry.strip())
+            continue
+        if tag_start in upper or upper == compound_boundary:
+            tag_entries.setdefault(lexicon, {})[entry.strip()] = upper
+        else:
+            lexemes.setdefault(upper, []).append((lexicon, entry.strip()))
+    lexeme_counts = dict.fromkeys(lexemes, 0.0)
+    types = len(lexemes)
+    for lexeme, count in counts.lexemes.items():
+        if lexeme in lexeme_counts:
+            lexeme_counts[lexeme] = count
+        else:
+            types += 1
+    weights = {}
+    for lexeme, entries in lexemes.items():
+        weight = logprob(lexeme_counts[lexeme], counts.lexemes.total, types,
+                         alpha)
+        for key in entries:
+            weights[key] = weight
+    uppers = {upper for entries in tag_entries.values()
+              for upper in entries.values()}
+    upper_tags = {upper: split_tags(upper, tag_start) for upper in uppers
+                  if upper != compound_boundary}
+    upper_counts = dict.fromkeys(uppers, 0.0)
+    # The count of the empty entries of each lexicon with tag entries.
+    unmatched = {lexicon: 0.0 for lexicon in tag_entries
+                 if lexicon in empty_entries}
+    for tag_sequence, count in counts.tags.items():
+        if tag_sequence == compound_boundary:
+            if compound_boundary in upper_counts:
+                upper_counts[compound_boundary] += count
+            continue
+        tags = split_tags(tag_sequence, tag_start)
+        matched = set()
+        for upper, run in upper_tags.items():
+            if _contains_run(tags, run):
+                upper_counts[upper] += count
+                matched.add(upper)
+        for lexicon in unmatched:
+            if matched.isdisjoint(tag_entries[lexicon].values()):
+                unmatched[lexicon] += count
+    for lexicon, entries in tag_entries.items():
+        empties = empty_entries.get(lexicon, []) if lexicon in unmatched \
+            else []
+        total = sum(upper_counts[upper] for upper in entries.values()) + \
+            unmatched.get(lexicon, 0.0)
+        types = len(entries) + len(empties)
+        for entry, upper in entries.items():
+            weights[(lexicon, entry)] = logprob(upper_counts[upper], total,
+                                                types, alpha)
+        for entry in empties:
+            weights[(lexicon, entry)] = logprob(
+                unmatched[lexicon] / len(empties), total, types, alpha)
+    return weights
+
+
+def weight_lexc(lexc_text, counts, **kwargs):
+    """Return *lexc_text* with the weights of entry_weights written in.
+
+    Each weighted entry gets a "weight: X" string before its semicolon,
+    replacing an existing one; everything else, comments included, is
+    kept. Entries are expected one per line, as in the course files.
+    Keyword arguments are passed to entry_weights.
+    """
+    weights = entry_weights(lexc_text, counts, **kwargs)
+    lines = []
+    for line, lexicon, entry, rest in _entry_lines(lexc_text):
+        key = (lexicon, entry.strip()) if entry is not None else None
+        if key not in weights:
+            lines.append(line)
+            continue
+        entry = strip_weight(entry)
+        lines.append('%s "weight: %.5f" %s' % (entry.rstrip(), weights[key],
+                                                rest))
+    return ''.join(lines)
+
+
+def lexeme_weighter(counts, alphabet, alpha=1.0, tag_start='+',
+                    compound_boundary='#'):
+    """Return an acceptor of analyses that weights each of their lexemes.
+
+    The acceptor accepts the analyses over *alphabet* (the symbols of the
+    analysis side of a transducer) and adds the logprob of each lexeme,
+    an unseen lexeme getting the weight of a count of 0. Tags are not
+    weighted.
+    """
+    lexeme_counts = list(counts.lexemes.items())
+    # The lexemes of the corpus and one class of unseen lexemes.
+    types = len(lexeme_counts) + 1
+    tags = sorted(symbol for symbol in alphabet if symbol.startswith(tag_start))
+    letters = sorted(symbol for symbol in alphabet
+                     if not symbol.startswith(tag_start) and
+                     symbol != compound_boundary and not symbol.startswith('@'))
+    if not letters:
+        raise ValueError('no lexeme symbols in the alphabet')
+    if lexeme_counts:
+        known = fst(tuple((lexeme, logprob(count, counts.lexemes.total, types,
+                                           alpha))
+                          for lexeme, count in lexeme_counts))
+        seen = fst(tuple(lexeme for lexeme, _ in lexeme_counts))
+    else:
+        known = HfstTransducer()
+        seen = HfstTransducer()
+    unseen = regex('[%s]+' % '|'.join(quote(symbol) for symbol in letters))
+    unseen.subtract(seen)
+    unseen.set_final_weights(logprob(0, counts.lexemes.total, types, alpha))
+    lexeme = HfstTransducer(known)
+    lexeme.disjunct(unseen)
+    if compound_boundary:
+        rest = HfstTransducer(lexeme)
+        boundary = regex(quote(compound_boundary))
+        boundary.concatenate(rest)
+        boundary.repeat_star()
+        lexeme.concatenate(boundary)
+    if tags:
+        tail = regex('([%s] ?*)' % '|'.join(quote(tag) for tag in tags))
+        lexeme.concatenate(tail)
+    lexeme.minimize()
+    return lexeme
+
+
+def reweight(transducer, counts, side='output', **kwargs):
+    """Return *transducer* with the lexeme weights of *counts* added.
+
+    *side* is the side of the analyses: 'output' for an analyzer, 'input'
+    for a generator. The weights of entry_weights for tag entries are
+    only written into lexc files; here only lexemes are weighted. Keyword
+    arguments are passed to lexeme_weighter.
+    """
+    if side not in ('input', 'output'):
+        raise ValueError('side must be input or output')
+    weighter = lexeme_weighter(counts, transducer.get_alphabet(), **kwargs)
+    if side == 'output':
+        result = HfstTransducer(transducer)
+        result.compose(weighter)
+    else:
+        result = weighter
+        result.compose(transducer)
+    result.minimize()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Estimate lexicon weights from the analyses of a corpus.')
+    parser.add_argument('analyzer', help='analyzer .hfst file')
+    parser.add_argument('corpus', help='corpus, tokens separated by whitespace')
+    parser.add_argument('--lexc', help='lexc file to write weights into')
+    parser.add_argument('-o', '--output', help='weighted lexc file to write')
+    parser.add_argument('--reweight', metavar='HFST',
+                        help='write the analyzer with lexeme weights here')
+    parser.add_argument('-j', '--processes', type=int, default=None)
+    parser.add_argument('--alpha', type=float, default=1.0,
+                        help='add-alpha smoothing constant')
+    parser.add_argument('--max-entries', type=int, default=DEFAULT_MAX_ENTRIES,
+                        help='counter entries kept in memory before spilling')
+    args = parser.parse_args(argv)
+    counts = count_corpus(args.analyzer, args.corpus, args.processes,
+                          max_entries=args.max_entries)
+    with counts.lexemes, counts.tags:
+        print('%i tokens, %i without analyses' % (counts.tokens,
+                                                  counts.unknown))
+        if args.lexc:
+            with open(args.lexc, encoding='utf-8') as f:
+                text = weight_lexc(f.read(), counts, alpha=args.alpha)
+            if args.output:
+                with open(args.output, 'w', encoding='utf-8') as f:
+                    f.write(text)
+            else:
+                print(text, end='')
+        if args.reweight:
+            analyzer = HfstTransducer.read_from_file(args.analyzer)
+            reweight(analyzer, counts, alpha=args.alpha).write_to_file(
+                args.reweight)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Incremental construction of minimal acceptors from sorted word lists.
+
+Lecture 2 builds an acceptor for a set of words with
+
+    fst(('clear', 'clever', 'ear', 'ever')).minimize()
+
+which first creates the whole non-minimal automaton. MinimalAcceptorBuilder
+uses the algorithm for sorted data of Daciuk, Mihov, Watson and Watson
+(2000), "Incremental Construction of Minimal Acyclic Finite-State
+Automata". The automaton is kept minimal after each word, except for the
+path of the last added word, so its size never grows much beyond that of
+the result.
+
+    from compmorph.incremental import acceptor_from_words
+    from compmorph.bulk import read_words
+    acceptor = acceptor_from_words(read_words('german-words.txt'), presort=True)
+
+The result is an HfstTransducer for which compare() with the fst(...)
+result above returns True.
+"""
+
+from hfst_dev import HfstIterableTransducer, HfstTransducer
+
+
+class _State:
+
+    __slots__ = ('final', 'edges')
+
+    def __init__(self):
+        self.final = False
+        self.edges = {}
+
+    def signature(self):
+        # Children are already registered, so they are unique objects and
+        # can be compared by identity.
+        return (self.final,
+                tuple((symbol, id(child)) for symbol, child in self.edges.items()))
+
+
+class MinimalAcceptorBuilder:
+    """Build a minimal acyclic acceptor from words added in sorted order.
+
+    Words must be added in increasing code point order, i.e. the order of
+    sorted(). Adding a word equal to the previous one has no effect.
+    """
+
+    def __init__(self):
+        self._root = _State()
+        self._register = {}
+        self._previous = ''
+        self._path = [self._root]
+        self._finished = False
+        self.words = 0
+
+    def add(self, word):
+        if self._finished:
+            raise RuntimeError('cannot add words after to_transducer()')
+        previous = self._previous
+        if word == previous and self.words > 0:
+            return
+        if word < previous:
+            raise ValueError('words must be added in sorted order: %r after %r'
+                             % (word, previous))
+        common = 0
+        for a, b in zip(previous, word):
+            if a != b:
+                break
+            common += 1
+        self._replace_or_register(common)
+        path = self._path
+        state = path[-1]
+        for symbol in word[common:]:
+            child = _State()
+            state.edges[symbol] = child
+            path.append(child)
+            state = child
+        state.final = True
+        self._previous = word
+        self.words += 1
+
+    def add_all(self, words):
+        for word in words:
+            self.add(word)
+        return self
+
+    def _replace_or_register(self, common):
+        # Minimize the suffix of the previous word below its first *common*
+        # symbols, deepest state first.
+        path = self._path
+        previous = self._previous
+        register = self._register
+        for depth in range(len(path) - 1, common, -1):
+            child = path[depth]
+            signature = child.signature()
+            existing = register.get(signature)
+            if existing is None:
+                register[signature] = child
+            else:
+                path[depth - 1].edges[previous[depth - 1]] = existing
+        del path[common + 1:]
+
+    def number_of_states(self):
+        """Return the number of states of the automaton built so far."""
+        return len(self._register) + len(self._path)
+
+    def to_iterable_transducer(self):
+        """Finish the automaton and return it as an HfstIterableTransducer."""
+        if not self._finished:
+            self._replace_or_register(0)
+            self._finished = True
+        numbers = {id(self._root): 0}
+        queue = [self._root]
+        result = HfstIterableTransducer()
+        for state in queue:
+            source = numbers[id(state)]
+            if state.final:
+                result.set_final_weight(source, 0.0)
+            for symbol, child in state.edges.items():
+                target = numbers.get(id(child))
+                if target is None:
+                    target = len(numbers)
+                    numbers[id(child)] = target
+                    result.add_state(target)
+                    queue.append(child)
+                result.add_transition(source, target, symbol, symbol, 0.0)
+        return result
+
+    def to_transducer(self):
+        """Finish the automaton and return it as an HfstTransducer."""
+        return HfstTransducer(self.to_iterable_transducer())
+
+
+def acceptor_from_words(words, presort=False):
+    """Return a minimal acceptor for *words* as an HfstTransducer.
+
+    *words* must be in sorted order unless *presort* is true, in which case
+    they are read into memory and sorted first.
+    """
+    if presort:
+        words = sorted(set(words))
+    return MinimalAcceptorBuilder().add_all(words).to_transducer()
@@ -0,0 +1,124 @@
+"""Word-level language identification with one transducer.
+
+Instead of looking up a token in the vocabulary of every language, the
+vocabularies are compiled into a single minimized transducer. Its input
+side is the union of all word lists (built with fst and disjunct as in
+Lecture 2, section 2.2) and its output side is the tag of the language,
+e.g. "<finnish>". One lookup gives all languages that contain the token:
+
+    from compmorph.langid import LanguageIdentifier
+    identifier = LanguageIdentifier.from_word_lists(
+        ['english-words.txt', 'finnish-words.txt', 'french-words.txt',
+         'german-words.txt', 'swedish-words.txt'])
+    print(identifier.languages('alpi'))
+    print(identifier.build_seconds)
+
+Running the module prints the build time and the query time for the given
+word lists, e.g. the five lists of Lecture 5:
+
+    python3 -m compmorph.langid Lecture5/*-words.txt
+"""
+
+import argparse
+import os
+import time
+
+from hfst_dev import disjunct, fst, regex
+
+from compmorph.bulk import optimized_for_lookup, read_words
+
+
+def language_tag(language):
+    return '<%s>' % language
+
+
+def language_name(path):
+    """Return the language of a word list file, e.g. 'finnish-words.txt' -> 'finnish'."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    if name.endswith('-words'):
+        name = name[:-len('-words')]
+    return name
+
+
+def vocabulary_tagger(language, words):
+    """Return a transducer that maps each of *words* to the tag of *language*."""
+    vocabulary = fst(tuple(words))
+    vocabulary.minimize()
+    # Erase the word on the output side and append the language tag.
+    vocabulary.compose(regex('[?:0]*'))
+    vocabulary.concatenate(regex('0:"%s"' % language_tag(language)))
+    vocabulary.minimize()
+    return vocabulary
+
+
+class LanguageIdentifier:
+    """Find the languages whose vocabulary contains a token."""
+
+    def __init__(self, transducer, languages, build_seconds=0.0):
+        self.transducer = optimized_for_lookup(transducer)
+        self.languages_by_tag = {language_tag(language): language
+                                 for language in languages}
+        self.build_seconds = build_seconds
+
+    @classmethod
+    def from_vocabularies(cls, vocabularies):
+        """Build an identifier from a dict mapping languages to word lists."""
+        start = time.perf_counter()
+        taggers = [vocabulary_tagger(language, words)
+                   for language, words in vocabularies.items()]
+        transducer = disjunct(taggers)
+        transducer.minimize()
+        return cls(transducer, vocabularies,
+                   build_seconds=time.perf_counter() - start)
+
+    @classmethod
+    def from_word_lists(cls, paths):
+        """Build an identifier from files with one word per line.
+
+        The language names are taken from the file names, see language_name.
+        """
+        return cls.from_vocabularies({language_name(path): read_words(path)
+                                      for path in paths})
+
+    def languages(self, token):
+        """Return the sorted list of languages that contain *token*."""
+        return sorted(self.languages_by_tag[output]
+                      for output, weight in self.transducer.lookup(token))
+
+    def classify(self, source):
+        """Yield (token, languages) for each token of *source*.
+
+        *source* is handled as in compmorph.bulk.read_words.
+        """
+        for token in read_words(source):
+            yield token, self.languages(token)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Build a language identifier from word lists and '
+                    'report build and query times.')
+    parser.add_argument('word_lists', nargs='+',
+                        help='files named LANGUAGE-words.txt')
+    parser.add_argument('--save', metavar='FILE',
+                        help='write the transducer to FILE')
+    args = parser.parse_args(argv)
+    identifier = LanguageIdentifier.from_word_lists(args.word_lists)
+    print('build: %.3f s' % identifier.build_seconds)
+    if args.save:
+        identifier.transducer.write_to_file(args.save)
+    tokens = 0
+    ambiguous = 0
+    start = time.perf_counter()
+    for path in args.word_lists:
+        for token, languages in identifier.classify(path):
+            tokens += 1
+            if len(languages) > 1:
+                ambiguous += 1
+    seconds = time.perf_counter() - start
+    print('query: %i tokens in %.3f s, %.0f tokens/s, %i in several languages'
+          % (tokens, seconds, tokens / seconds if seconds else 0.0, ambiguous))
+
+
+if __name__ == '__main__':
+    main()
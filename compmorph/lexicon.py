@@ -0,0 +1,210 @@
+"""Adding lexemes to a compiled lexicon without recompiling it.
+
+In Assignments 1.3 and 1.4 new nouns are added by editing
+en_ia_morphology_template.lexc and compiling, inverting and minimizing the
+whole lexicon again. ExtensibleLexicon instead compiles only the new
+entries together with the continuation lexicons they use (N, Num,
+PossWithS, ... for a noun of class N). The result is kept minimized as a
+separate, small transducer next to the unchanged original one, so adding
+lexemes costs time in proportion to the new entries only. Lookup consults
+both transducers; to_transducer() merges them into one when needed, e.g.
+before writing the lexicon to a file.
+
+    from compmorph.lexicon import ExtensibleLexicon
+    analyzer = ExtensibleLexicon.from_lexc_file(
+        'en_ia_morphology_template.lexc', analyzer=True)
+    analyzer.add('book', 'N')
+    analyzer.add('doggy:dogg', 'N_y')
+    analyzer.add_all([('search', 'N_s'), ('waitress', 'N_s')])
+    print(analyzer.lookup('doggies'))
+"""
+
+import re
+
+from hfst_dev import HfstTransducer, compile_lexc_file, compile_lexc_script
+
+from compmorph.bulk import optimized_for_lookup
+
+_LEXICON = re.compile(r'^\s*LEXICON\s+(\S+)', re.MULTILINE)
+_END = re.compile(r'^\s*END\b', re.MULTILINE)
+# A comment starts with an exclamation mark that is not escaped with %.
+_COMMENT = re.compile(r'(?<!%)!.*')
+
+
+# The weight at the end of an entry, e.g. "weight: 3.69897".
+_WEIGHT = re.compile(r'\s*"weight:\s*[^"]*"\s*$')
+
+
+def strip_comments(text):
+    """Return the lexc source *text* without its comments."""
+    return _COMMENT.sub('', text)
+
+
+def strip_weight(entry):
+    """Return the lexc entry *entry* without its weight, if it has one."""
+    return _WEIGHT.sub('', entry)
+
+
+def parse_lexc(text):
+    """Split the lexc source *text* into its header and its lexicons.
+
+    Return a pair (header, lexicons), where header is the text before the
+    first LEXICON (e.g. the Multichar_Symbols declaration) and lexicons maps
+    each lexicon name to the list of its entries. An entry is the text of
+    one entry without its final semicolon and comments, e.g. 'sky:sk N_y'.
+    """
+    text = strip_comments(text)
+    end = _END.search(text)
+    if end is not None:
+        text = text[:end.start()]
+    matches = list(_LEXICON.finditer(text))
+    header = text[:matches[0].start()] if matches else text
+    lexicons = {}
+    for index, match in enumerate(matches):
+        stop = matches[index + 1].start() if index + 1 < len(matches) else len(text)
+        body = text[match.end():stop]
+        entries = [' '.join(entry.split()) for entry in _split_entries(body)]
+        lexicons[match.group(1)] = [entry for entry in entries if entry]
+    return header, lexicons
+
+
+def _split_entries(body):
+    # Split at semicolons that are not escaped with %.
+    entry = []
+    escaped = False
+    for char in body:
+        if escaped:
+            entry.append(char)
+            escaped = False
+        elif char == '%':
+            entry.append(char)
+            escaped = True
+        elif char == ';':
+            yield ''.join(entry)
+            entry = []
+        else:
+            entry.append(char)
+
+
+def continuation(entry):
+    """Return the continuation lexicon of *entry*, e.g. 'N_y' for 'sky:sk N_y'.
+
+    A weight after the continuation, as in 'cat N "weight: 3.69897"', is
+    skipped.
+    """
+    return strip_weight(entry).split()[-1]
+
+
+def reachable_lexicons(lexicons, names):
+    """Return the names of *names* and all lexicons they continue to, in order."""
+    reachable = []
+    stack = list(reversed(names))
+    while stack:
+        name = stack.pop()
+        if name == '#' or name in reachable:
+            continue
+        if name not in lexicons:
+            raise KeyError('no such lexicon: %s' % name)
+        reachable.append(name)
+        stack.extend(reversed([continuation(entry)
+                               for entry in lexicons[name]]))
+    return reachable
+
+
+class ExtensibleLexicon:
+    """A compiled lexicon that new lexemes can be added to.
+
+    *transducer* is the compiled lexicon and *lexc_text* the lexc source it
+    was compiled from; the continuation lexicons of new entries are taken
+    from it. If *analyzer* is true, *transducer* is an inverted lexicon
+    (surface forms to analyses) and the new entries are inverted too.
+    """
+
+    def __init__(self, transducer, lexc_text, analyzer=False):
+        self.header, self.lexicons = parse_lexc(lexc_text)
+        self.analyzer = analyzer
+        self.base = HfstTransducer(transducer)
+        self._base_lookup = optimized_for_lookup(self.base)
+        self.entries = []
+        self.additions = None
+        self._additions_lookup = None
+
+    @classmethod
+    def from_lexc_file(cls, path, analyzer=False):
+        """Compile the lexc file *path* and return it as an ExtensibleLexicon."""
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+        transducer = compile_lexc_file(path)
+        if analyzer:
+            transducer.invert()
+            transducer.minimize()
+        return cls(transducer, text, analyzer)
+
+    def _lexc_for(self, entries):
+        names = reachable_lexicons(self.lexicons,
+                                   sorted({continuation(entry)
+                                           for entry in entries}))
+        if 'Root' in names:
+            raise ValueError('new entries must not continue to lexicon Root')
+        lines = [self.header.strip(), '', 'LEXICON Root']
+        lines.extend(entry + ' ;' for entry in entries)
+        for name in names:
+            lines.extend(['', 'LEXICON ' + name])
+            lines.extend(entry + ' ;' for entry in self.lexicons[name])
+        lines.extend(['', 'END', ''])
+        return '\n'.join(lines)
+
+    def add(self, entry, continuation_lexicon):
+        """Add the lexc entry *entry* with the continuation *continuation_lexicon*.
+
+        *entry* is written as in lexc, e.g. 'book' or 'doggy:dogg'.
+        """
+        self.add_all([(entry, continuation_lexicon)])
+
+    def add_all(self, entries):
+        """Add (entry, continuation lexicon) pairs, see add."""
+        new_entries = ['%s %s' % (entry, continuation_lexicon)
+                       for entry, continuation_lexicon in entries]
+        if not new_entries:
+            return
+        # Only the new entries are compiled; earlier additions are kept
+        # compiled and the new ones are joined to them.
+        compiled = compile_lexc_script(self._lexc_for(new_entries))
+        if self.analyzer:
+            compiled.invert()
+        if self.additions is None:
+            additions = compiled
+        else:
+            additions = HfstTransducer(self.additions)
+            additions.disjunct(compiled)
+        additions.minimize()
+        self.entries.extend(new_entries)
+        self.additions = additions
+        self._additions_lookup = optimized_for_lookup(additions)
+
+    def lexc_entries(self):
+        """Return the added entries as lines of lexc, e.g. 'book N ;'."""
+        return [entry + ' ;' for entry in self.entries]
+
+    def lookup(self, input, **kwargs):
+        """Look up *input* in the original lexicon and in the added entries.
+
+        If both give the same output, the smaller weight is kept.
+        """
+        results = {}
+        lookups = [self._base_lookup]
+        if self._additions_lookup is not None:
+            lookups.append(self._additions_lookup)
+        for transducer in lookups:
+            for output, weight in transducer.lookup(input, **kwargs):
+                if weight < results.get(output, float('inf')):
+                    results[output] = weight
+        return tuple(results.items())
+
+    def to_transducer(self):
+        """Return the original lexicon and the added entries as one minimal transducer."""
+        result = HfstTransducer(self.base)
+        if self.additions is not None:
+            result.disjunct(self.additions)
+            result.minimize()
+        return result
@@ -0,0 +1,183 @@
+"""The best outputs of a weighted lookup, without finding all of them.
+
+The spell checker of Lecture 3, [ NoisyVocabulary ].i, gives every
+correction of a word with its weight when used with `apply up`, and
+lookup() gives them all too, although only the few lightest ones are
+wanted. NBestLookup follows the paths of the input through the transducer
+in the order of their weights (a best-first search over tropical weights)
+and stops once it has found *k* outputs, or when the paths get heavier
+than *max_weight*, or when the time is up:
+
+    from compmorph.nbest import NBestLookup
+    corrector = NBestLookup(spellchecker)
+    print(corrector.lookup('fight', k=3))
+    print(corrector.lookup('fight', k=10, max_weight=5.0, time_limit=0.01))
+
+The k results are those of lookup() sorted by weight, as long as the
+weights are non-negative; outputs with equal weights may come in another
+order. Flag diacritics are left out of the outputs but not checked.
+"""
+
+import heapq
+import itertools
+import time
+
+from compmorph.paths import Graph
+from compmorph.symbols import IDENTITY, UNKNOWN, is_visible, tokenize
+
+# The input symbol of all arcs that consume nothing: epsilons and, since
+# they are not checked, flag diacritics.
+EPSILON_INPUT = ''
+
+DEFAULT_MAX_EXPANSIONS = 100000
+
+
+class NBestLookup:
+    """Best-first lookup in *transducer*.
+
+    The arcs of the transducer are read into Python once, so the
+    transducer can be in any format. If *filter_flags* is false, flag
+    diacritics are kept in the outputs.
+    """
+
+    def __init__(self, transducer, filter_flags=True):
+        graph = Graph(transducer)
+        self.finals = graph.finals
+        self.filter_flags = filter_flags
+        # arcs[state][input symbol] is a list of (output, target, weight).
+        self.arcs = {}
+        self.alphabet = set()
+        for state, arcs in graph.arcs.items():
+            by_input = {}
+            for input, output, target, weight in arcs:
+                if not is_visible(input, True):
+                    input = EPSILON_INPUT
+                by_input.setdefault(input, []).append((output, target, weight))
+                if input not in (EPSILON_INPUT, IDENTITY, UNKNOWN):
+                    self.alphabet.add(input)
+            self.arcs[state] = by_input
+        self._longest = max((len(symbol) for symbol in self.alphabet), default=1)
+
+    def tokenize(self, input):
+        """Split *input* into input symbols, taking the longest match first."""
+        return tokenize(input, self.alphabet, self._longest)
+
+    def _moves(self, state, token):
+        # The (output, target, weight) arcs that consume token in state.
+        arcs = self.arcs.get(state, {})
+        moves = list(arcs.get(token, ()))
+        if token not in self.alphabet:
+            moves.extend((token, target, weight)
+                         for _, target, weight in arcs.get(IDENTITY, ()))
+            moves.extend((token if output in (IDENTITY, UNKNOWN) else output,
+                          target, weight)
+                         for output, target, weight in arcs.get(UNKNOWN, ()))
+        return moves
+
+    def lookup(self, input, k=5, max_weight=None, time_limit=None,
+               max_expansions=DEFAULT_MAX_EXPANSIONS, stats=None):
+        """Return the *k* lightest (output, weight) pairs of *input*.
+
+        The search stops early when the lightest remaining path weighs more
+        than *max_weight*, after *time_limit* seconds or after
+        *max_expansions* partial paths (which guards against cycles
+        that consume no input); the results found until then are returned. Each output
+        occurs once, with its smallest weight. If a dict is given as
+        *stats*, the number of expanded paths, the time and the reason for
+        stopping ('k', 'weight', 'time', 'expansions' or 'exhausted') are
+        stored in it.
+        """
+        start = time.perf_counter()
+        tokens = self.tokenize(input)
+        counter = itertools.count()
+        # A partial path is (state, position in tokens, output so far); a
+        # complete one is pushed again with its final weight added. A path
+        # that reaches a settled partial path again is heavier and can only
+        # lead to the same outputs, so it is dropped.
+        queue = [(0.0, next(counter), False, (0, 0, ''))]
+        results = []
+        seen = set()
+        settled = set()
+        expansions = 0
+        stopped = 'exhausted'
+        while queue:
+            if len(results) >= k:
+                stopped = 'k'
+                break
+            if max_weight is not None and queue[0][0] > max_weight:
+                stopped = 'weight'
+                break
+            if expansions >= max_expansions:
+                stopped = 'expansions'
+                break
+            if time_limit is not None and \
+                    time.perf_counter() - start > time_limit:
+                stopped = 'time'
+                break
+            weight, _, complete, node = heapq.heappop(queue)
+            if complete:
+                if node[2] not in seen:
+                    seen.add(node[2])
+                    results.append((node[2], weight))
+                continue
+            if node in settled:
+                continue
+            settled.add(node)
+            expansions += 1
+            state, position, output_so_far = node
+            if position == len(tokens) and state in self.finals:
+                heapq.heappush(queue, (weight + self.finals[state],
+                                       next(counter), True, node))
+            moves = [(output, target, arc_weight, position)
+                     for output, target, arc_weight
+                     in self.arcs.get(state, {}).get(EPSILON_INPUT, ())]
+            if position < len(tokens):
+                moves.extend((output, target, arc_weight, position + 1)
+                             for output, target, arc_weight
+                             in self._moves(state, tokens[position]))
+            for output, target, arc_weight, following in moves:
+                if not is_visible(output, self.filter_flags):
+                    output = ''
+                heapq.heappush(queue, (weight + arc_weight, next(counter),
+                                       False, (target, following,
+                                               output_so_far + output)))
+        if stats is not None:
+            stats.update(expansions=expansions, stopped=stopped,
+                         seconds=time.perf_counter() - start)
+        return tuple(results)
+
+
+def full_lookup(transducer, input, k=5):
+    """Return the *k* lightest results of transducer.lookup(input), sorted."""
+    best = {}
+    for output, weight in transducer.lookup(input):
+        if weight < best.get(output, float('inf')):
+            best[output] = weight
+    return tuple(sorted(best.items(), key=lambda item: (item[1], item[0]))[:k])
+
+
+def compare_latency(transducer, inputs, k=5, **kwargs):
+    """Compare NBestLookup with lookup() followed by sorting on *inputs*.
+
+    Keyword arguments are passed to NBestLookup.lookup. Return a dict with
+    the average seconds per input of both and the number of inputs whose
+    k best weights differ (which should be 0 unless a budget stopped the
+    search early).
+    """
+    inputs = list(inputs)
+    nbest = NBestLookup(transducer)
+    start = time.perf_counter()
+    expected = [full_lookup(transducer, input, k) for input in inputs]
+    full_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    found = [nbest.lookup(input, k, **kwargs) for input in inputs]
+    nbest_seconds = time.perf_counter() - start
+    differences = sum(1 for a, b in zip(expected, found)
+                      if [round(w, 4) for _, w in a] !=
+                      [round(w, 4) for _, w in b])
+    count = max(len(inputs), 1)
+    return {'inputs': len(inputs),
+            'k': k,
+            'full_lookup_seconds': full_seconds / count,
+            'nbest_seconds': nbest_seconds / count,
+            'differences': differences}
@@ -0,0 +1,99 @@
+"""Fast detection of out-of-vocabulary words.
+
+Assignment 5.1e asks for words that the analyzer cannot analyze. Calling
+lookup() on the analyzer and checking for an empty result builds every
+analysis of every known word. Here the surface side of the analyzer is
+extracted once with input_project (see Lecture 2, section 2.6),
+determinized and minimized. Checking a word then only needs one
+deterministic walk through an acceptor.
+
+    from compmorph.oov import surface_acceptor, find_oov
+    acceptor = surface_acceptor(analyzer)
+    report = find_oov(acceptor, 'finnish-words.txt')
+    print(report)
+"""
+
+from hfst_dev import HfstTransducer, ImplementationType
+
+from compmorph.bulk import read_words
+
+
+def surface_acceptor(analyzer):
+    """Return a lookup-optimized acceptor of the input side of *analyzer*.
+
+    *analyzer* is not modified. The acceptor accepts exactly the word forms
+    that *analyzer* gives at least one analysis for.
+    """
+    acceptor = HfstTransducer(analyzer)
+    if acceptor.get_type() in (ImplementationType.HFST_OL_TYPE,
+                               ImplementationType.HFST_OLW_TYPE):
+        acceptor.remove_optimization()
+    acceptor.input_project()
+    acceptor.remove_epsilons()
+    acceptor.minimize()
+    acceptor.lookup_optimize()
+    return acceptor
+
+
+def is_known(acceptor, word):
+    """Return whether *acceptor* accepts *word*."""
+    return len(acceptor.lookup(word)) > 0
+
+
+def iter_oov(acceptor, source):
+    """Yield the words of *source* that *acceptor* does not accept.
+
+    *source* is handled as in compmorph.bulk.read_words.
+    """
+    for word in read_words(source):
+        if not is_known(acceptor, word):
+            yield word
+
+
+class OovReport:
+    """Counts and examples of out-of-vocabulary words."""
+
+    def __init__(self, max_examples=20):
+        self.max_examples = max_examples
+        self.tokens = 0
+        self.oov_tokens = 0
+        self.oov_types = set()
+        self.examples = []
+
+    def add(self, word, known):
+        self.tokens += 1
+        if known:
+            return
+        self.oov_tokens += 1
+        if word not in self.oov_types:
+            self.oov_types.add(word)
+            if len(self.examples) < self.max_examples:
+                self.examples.append(word)
+
+    @property
+    def oov_rate(self):
+        if self.tokens == 0:
+            return 0.0
+        return self.oov_tokens / self.tokens
+
+    def as_dict(self):
+        return {'tokens': self.tokens, 'oov_tokens': self.oov_tokens,
+                'oov_types': len(self.oov_types), 'oov_rate': self.oov_rate,
+                'examples': list(self.examples)}
+
+    def __str__(self):
+        return '%i of %i tokens out of vocabulary (%.2f %%), e.g. %s' % \
+            (self.oov_tokens, self.tokens, 100 * self.oov_rate,
+             ', '.join(self.examples))
+
+
+def find_oov(acceptor, source, max_examples=20):
+    """Check all words of *source* against *acceptor*.
+
+    Return an OovReport with the number of out-of-vocabulary tokens and
+    types and at most *max_examples* example words in input order.
+    """
+    report = OovReport(max_examples)
+    for word in read_words(source):
+        report.add(word, is_known(acceptor, word))
+    return report
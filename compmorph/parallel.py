@@ -0,0 +1,101 @@
+"""Parallel analysis of word lists with a process pool.
+
+A word list is split into shards of consecutive lines. Each worker process
+reads the analyzer from an .hfst file once with
+HfstTransducer.read_from_file and then analyzes whole shards with
+compmorph.bulk.analyze_batched. The word list is read through
+compmorph.wordlists.WordList, so a worker decodes only the lines of its own
+shard. The results are merged back in input order,
+so the output is the same as that of the serial analyze_batched.
+
+    for chunk in analyze_parallel('analyzer.hfst', 'finnish-words.txt'):
+        for word, analyses, count in chunk:
+            ...
+"""
+
+import multiprocessing
+import time
+
+from hfst_dev import HfstTransducer
+
+from compmorph.bulk import BulkStats, DEFAULT_CHUNK_SIZE, analyze_batched, \
+    optimized_for_lookup
+from compmorph.wordlists import WordList
+
+DEFAULT_SHARD_SIZE = 10000
+
+# The analyzer of a worker process, set by _load_analyzer.
+_analyzer = None
+
+
+def _load_analyzer(analyzer_path):
+    global _analyzer
+    _analyzer = optimized_for_lookup(
+        HfstTransducer.read_from_file(analyzer_path))
+
+
+def _analyze_shard(args):
+    path, first_line, last_line, chunk_size, kwargs = args
+    stats = BulkStats()
+    with WordList(path) as words:
+        lines = words.lines(first_line, last_line)
+        chunks = list(analyze_batched(_analyzer, lines, chunk_size=chunk_size,
+                                      optimize=False, stats=stats, **kwargs))
+    return chunks, stats
+
+
+def shard_lines(path, shard_size=DEFAULT_SHARD_SIZE):
+    """Split the word list *path* into shards of *shard_size* words.
+
+    Return a list of (first_line, last_line) pairs, last_line exclusive.
+    Empty lines do not count as words, so each shard except the last one
+    contains exactly *shard_size* words.
+    """
+    if shard_size < 1:
+        raise ValueError('shard_size must be positive')
+    shards = []
+    first_line = 0
+    words = 0
+    with WordList(path) as word_list:
+        line_count = len(word_list)
+        for line_number in range(line_count):
+            if not word_list.is_blank(line_number):
+                words += 1
+                if words == shard_size:
+                    shards.append((first_line, line_number + 1))
+                    first_line = line_number + 1
+                    words = 0
+    if words > 0:
+        shards.append((first_line, line_count))
+    return shards
+
+
+def analyze_parallel(analyzer_path, path, processes=None,
+                     chunk_size=DEFAULT_CHUNK_SIZE,
+                     shard_size=DEFAULT_SHARD_SIZE, stats=None, **kwargs):
+    """Analyze the word list *path* with the analyzer file *analyzer_path*.
+
+    Yield lists of Analysis objects in input order, exactly as
+    analyze_batched does for the same *chunk_size*. *shard_size* is rounded
+    up to a multiple of *chunk_size* so that chunks never cross shard
+    borders. *processes* is the number of worker processes, by default the
+    number of CPUs. If a BulkStats object is given as *stats*, the counters
+    of all shards are added to it and its seconds are set to the wall-clock
+    time of the whole run. Other keyword arguments are passed to
+    HfstTransducer.lookup.
+    """
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be positive')
+    shard_size = -(-shard_size // chunk_size) * chunk_size
+    tasks = [(path, first, last, chunk_size, kwargs)
+             for first, last in shard_lines(path, shard_size)]
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes, initializer=_load_analyzer,
+                              initargs=(analyzer_path,)) as pool:
+        for chunks, shard_stats in pool.imap(_analyze_shard, tasks):
+            if stats is not None:
+                stats.words += shard_stats.words
+                stats.lookups += shard_stats.lookups
+                stats.chunks += shard_stats.chunks
+                stats.seconds = time.perf_counter() - start
+            yield from chunks
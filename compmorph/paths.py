@@ -0,0 +1,164 @@
+"""Lazy enumeration of the paths of a transducer.
+
+extract_paths() and `lower-words` (Lecture 2) build all paths of a network
+at once, which is impossible for a cyclic lexicon such as the Finnish
+compound lexicon of Assignment 3.1 and expensive for a large one.
+iter_paths is a generator: it yields one path at a time and stops at the
+given limits.
+
+    from compmorph.paths import iter_paths
+    for input, output, weight in iter_paths(lexicon, max_paths=100,
+                                            max_cycles=1):
+        print(input, output, weight)
+
+With order='depth-first' (the default) the memory used grows only with
+the length of the current path. The arcs of each state are tried in the
+order of their (input, output) symbol names, so the paths come in the
+order of their symbol sequences, which is not that of their strings:
+epsilons, flag diacritics and multichar symbols sort by their names, and
+a path epsilon z comes before a path a. With order='weight' the paths are
+yielded from the lightest to the heaviest; this is a best-first search
+whose queue of partial paths may grow large.
+"""
+
+import heapq
+import itertools
+
+from hfst_dev import HfstIterableTransducer
+
+from compmorph.symbols import is_visible
+
+ORDERS = ('depth-first', 'weight')
+
+
+class Graph:
+    """The arcs and final weights of *transducer* as plain Python data.
+
+    arcs maps each state to a list of (input, output, target, weight)
+    sorted by the symbols, and finals maps the final states to their
+    final weights.
+    """
+
+    def __init__(self, transducer):
+        fsm = HfstIterableTransducer(transducer)
+        self.arcs = {}
+        self.finals = {}
+        for state in fsm.states():
+            arcs = [(arc.get_input_symbol(), arc.get_output_symbol(),
+                     arc.get_target_state(), arc.get_weight())
+                    for arc in fsm.transitions(state)]
+            arcs.sort(key=lambda arc: (arc[0], arc[1]))
+            self.arcs[state] = arcs
+            if fsm.is_final_state(state):
+                self.finals[state] = fsm.get_final_weight(state)
+
+
+def _depth_first(graph, max_length, max_cycles, filter_flags):
+    # visits[state] is the number of times state is on the current path.
+    visits = {0: 1}
+    inputs = []
+    outputs = []
+    weights = [0.0]
+    stack = [(0, iter(graph.arcs.get(0, ())))]
+    if 0 in graph.finals:
+        yield '', '', graph.finals[0]
+    while stack:
+        state, arcs = stack[-1]
+        arc = next(arcs, None)
+        if arc is None:
+            stack.pop()
+            visits[state] -= 1
+            if stack:
+                inputs.pop()
+                outputs.pop()
+                weights.pop()
+            continue
+        input, output, target, weight = arc
+        if max_length is not None and len(inputs) >= max_length:
+            continue
+        if max_cycles is not None and visits.get(target, 0) > max_cycles:
+            continue
+        visits[target] = visits.get(target, 0) + 1
+        inputs.append(input if is_visible(input, filter_flags) else '')
+        outputs.append(output if is_visible(output, filter_flags) else '')
+        weights.append(weights[-1] + weight)
+        stack.append((target, iter(graph.arcs.get(target, ()))))
+        if target in graph.finals:
+            yield (''.join(inputs), ''.join(outputs),
+                   weights[-1] + graph.finals[target])
+
+
+def _best_first(graph, max_length, max_cycles, filter_flags):
+    # A partial path is a linked list node (state, input, output, length,
+    # parent), so that paths with a common prefix share it.
+    counter = itertools.count()
+    start = (0, '', '', 0, None)
+    queue = [(0.0, next(counter), False, start)]
+    while queue:
+        weight, _, complete, node = heapq.heappop(queue)
+        if complete:
+            inputs = []
+            outputs = []
+            while node is not None:
+                inputs.append(node[1])
+                outputs.append(node[2])
+                node = node[4]
+            yield ''.join(reversed(inputs)), ''.join(reversed(outputs)), weight
+            continue
+        state = node[0]
+        if state in graph.finals:
+            heapq.heappush(queue, (weight + graph.finals[state],
+                                   next(counter), True, node))
+        if max_length is not None and node[3] >= max_length:
+            continue
+        for input, output, target, arc_weight in graph.arcs.get(state, ()):
+            if max_cycles is not None:
+                visits = 0
+                ancestor = node
+                while ancestor is not None:
+                    if ancestor[0] == target:
+                        visits += 1
+                    ancestor = ancestor[4]
+                if visits > max_cycles:
+                    continue
+            child = (target,
+                     input if is_visible(input, filter_flags) else '',
+                     output if is_visible(output, filter_flags) else '',
+                     node[3] + 1, node)
+            heapq.heappush(queue, (weight + arc_weight, next(counter), False,
+                                   child))
+
+
+def iter_paths(transducer, max_paths=None, max_length=None, max_cycles=0,
+               order='depth-first', filter_flags=True):
+    """Yield the paths of *transducer* as (input, output, weight) triples.
+
+    At most *max_paths* paths are yielded, each of at most *max_length*
+    arcs. A state may occur on a path at most 1 + *max_cycles* times; None
+    means no limit, which makes the enumeration of a cyclic transducer
+    infinite unless other limits are given. Epsilons, and flag diacritics
+    if *filter_flags* is true, are left out of the strings. *order* is one
+    of ORDERS; the weight order assumes non-negative weights. The same
+    string pair may be yielded more than once if it has several paths.
+    """
+    if order not in ORDERS:
+        raise ValueError('unknown order: %s' % order)
+    graph = Graph(transducer)
+    if order == 'weight':
+        paths = _best_first(graph, max_length, max_cycles, filter_flags)
+    else:
+        paths = _depth_first(graph, max_length, max_cycles, filter_flags)
+    return itertools.islice(paths, max_paths)
+
+
+def iter_words(transducer, side='output', **kwargs):
+    """Yield the strings of one side of *transducer*, like `lower-words`.
+
+    *side* is 'input' (upper side) or 'output' (lower side). Keyword
+    arguments are passed to iter_paths. Duplicates are not removed.
+    """
+    if side not in ('input', 'output'):
+        raise ValueError('side must be input or output')
+    index = 0 if side == 'input' else 1
+    for path in iter_paths(transducer, **kwargs):
+        yield path[index]
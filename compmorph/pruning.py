@@ -0,0 +1,285 @@
+"""Composition that drops paths that are too heavy to be useful.
+
+The noisy vocabulary of the Lecture 3 spell checker,
+Vocabulary .o. Substitution, contains every misspelling the error model
+can make, however unlikely. pruned_compose builds the composition itself
+and leaves out every arc that can only be on paths heavier than a
+*threshold*, or heavier than the best path by more than a *beam*, so that
+the result only contains the corrections that could ever be suggested:
+
+    from compmorph.pruning import pruned_compose
+    noisy = pruned_compose(vocabulary, substitution, beam=4.0)
+    spellchecker = HfstTransducer(noisy)
+    spellchecker.invert()
+
+The search visits the states of the composition lightest first, guided
+by the lightest way to a final state in each operand (an A* search), and
+stops as soon as everything left is over the threshold, so the pruned
+parts are never built. *max_states* caps the number of states outright.
+The weights must be non-negative, as logprobs are.
+
+pruning_report shows the states saved and the corrections of a held-out
+list of misspellings lost at several thresholds or beams:
+
+    python3 -m compmorph.pruning vocabulary.hfst substitution.hfst \\
+        misspellings.tsv --beam 2 4 6
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+
+from hfst_dev import EPSILON, HfstIterableTransducer, HfstTransducer
+
+from compmorph.paths import Graph
+from compmorph.symbols import IDENTITY, UNKNOWN
+
+# Weights are sums of floats added in different orders, so a path exactly
+# at the limit may come out slightly above it.
+_TOLERANCE = 1e-9
+
+
+def _distances_to_final(graph):
+    # The weight of the lightest path from each state to a final state.
+    incoming = {}
+    for state, arcs in graph.arcs.items():
+        for _, _, target, weight in arcs:
+            incoming.setdefault(target, []).append((state, weight))
+    distances = {}
+    queue = [(weight, state) for state, weight in graph.finals.items()]
+    heapq.heapify(queue)
+    while queue:
+        distance, state = heapq.heappop(queue)
+        if state in distances:
+            continue
+        distances[state] = distance
+        for source, weight in incoming.get(state, ()):
+            if source not in distances:
+                heapq.heappush(queue, (distance + weight, source))
+    return distances
+
+
+class _Operand:
+    # The arcs of an operand indexed for composition.
+
+    def __init__(self, transducer):
+        graph = Graph(transducer)
+        self.finals = graph.finals
+        self.arcs = graph.arcs
+        self.distances = _distances_to_final(graph)
+        self.by_input = {}
+        self.alphabet = set()
+        for state, arcs in graph.arcs.items():
+            index = {}
+            for input, output, target, weight in arcs:
+                index.setdefault(input, []).append((output, target, weight))
+                self.alphabet.add(input)
+            self.by_input[state] = index
+
+
+def _moves(left, right, state):
+    # Yield (input, output, target, weight) for the arcs of the composed
+    # state (left state, right state, filter). The filter lets epsilon
+    # moves of the left operand come only before those of the right one,
+    # so that each path of the composition is built once.
+    left_state, right_state, epsilon_filter = state
+    right_arcs = right.by_input.get(right_state, {})
+    for input, output, target, weight in left.arcs.get(left_state, ()):
+        if output == EPSILON:
+            if epsilon_filter == 0:
+                yield input, EPSILON, (target, right_state, 0), weight
+            continue
+        matches = list(right_arcs.get(output, ()))
+        if output not in right.alphabet:
+            matches.extend((output, right_target, right_weight)
+                           for _, right_target, right_weight
+                           in right_arcs.get(IDENTITY, ()))
+            matches.extend((right_output, right_target, right_weight)
+                           for right_output, right_target, right_weight
+                           in right_arcs.get(UNKNOWN, ())
+                           if right_output not in (IDENTITY, UNKNOWN))
+        for right_output, right_target, right_weight in matches:
+            yield input, right_output, (target, right_target, 0), \
+                weight + right_weight
+    for right_output, right_target, right_weight in \
+            right_arcs.get(EPSILON, ()):
+        yield EPSILON, right_output, (left_state, right_target, 1), \
+            right_weight
+
+
+def pruned_compose(left, right, threshold=None, beam=None, max_states=None,
+                   stats=None):
+    """Return *left* .o. *right* without the paths that are too heavy.
+
+    Arcs that are only on paths weighing more than *threshold*, or more
+    than the lightest path plus *beam*, are left out, and at most
+    *max_states* states are built, the ones on the lightest paths first.
+    Without any limit the result is the whole composition. *left* may not
+    contain identity or unknown symbols on its output side; those of
+    *right* match the symbols of *left* as in HFST. If a dict is given as
+    *stats*, the numbers of states and arcs built and pruned and the
+    weight of the lightest path are stored in it.
+    """
+    left = _Operand(left)
+    right = _Operand(right)
+    if any(output in (IDENTITY, UNKNOWN)
+           for arcs in left.arcs.values() for _, output, _, _ in arcs):
+        raise ValueError('identity and unknown symbols are not supported '
+                         'on the output side of the left operand')
+    infinity = float('inf')
+
+    def estimate(state):
+        return left.distances.get(state[0], infinity) + \
+            right.distances.get(state[1], infinity)
+
+    limit = infinity if threshold is None else threshold + _TOLERANCE
+    best = None
+    # The weight of the lightest path to each built state.
+    weights = {}
+    counter = itertools.count()
+    start = (0, 0, 0)
+    # Items are (estimated total weight, counter, weight so far, state,
+    # final): a final item stands for the end of a complete path.
+    queue = [(estimate(start), next(counter), 0.0, start, False)]
+    while queue:
+        bound, _, weight, state, final = heapq.heappop(queue)
+        if bound > limit:
+            break
+        if final:
+            if best is None:
+                best = weight
+                if beam is not None:
+                    limit = min(limit, best + beam + _TOLERANCE)
+            continue
+        if state in weights:
+            continue
+        if max_states is not None and len(weights) >= max_states:
+            break
+        weights[state] = weight
+        if state[0] in left.finals and state[1] in right.finals:
+            final_weight = weight + left.finals[state[0]] + \
+                right.finals[state[1]]
+            heapq.heappush(queue, (final_weight, next(counter), final_weight,
+                                   state, True))
+        for _, _, target, arc_weight in _moves(left, right, state):
+            target_weight = weight + arc_weight
+            if target_weight + estimate(target) <= limit:
+                heapq.heappush(queue, (target_weight + estimate(target),
+                                       next(counter), target_weight, target,
+                                       False))
+    # The arcs are added once the final limit and the built states are
+    # known, with the same test as above.
+    fsm = HfstIterableTransducer()
+    ids = {}
+    for state in sorted(weights, key=lambda state: state != start):
+        ids[state] = fsm.add_state() if ids else 0
+    arcs = 0
+    pruned_arcs = 0
+    for state, weight in weights.items():
+        if state[0] in left.finals and state[1] in right.finals:
+            final_weight = left.finals[state[0]] + right.finals[state[1]]
+            if weight + final_weight <= limit:
+                fsm.set_final_weight(ids[state], final_weight)
+        for input, output, target, arc_weight in _moves(left, right, state):
+            if target in ids and \
+                    weight + arc_weight + estimate(target) <= limit:
+                fsm.add_transition(ids[state], ids[target], input, output,
+                                   arc_weight)
+                arcs += 1
+            else:
+                pruned_arcs += 1
+    result = HfstTransducer(fsm)
+    # Some arcs that pass the test still lead only to pruned states.
+    result.minimize()
+    if stats is not None:
+        stats.update(states=len(ids), arcs=arcs, pruned_arcs=pruned_arcs,
+                     best_weight=best)
+    return result
+
+
+def read_misspellings(path, encoding='utf-8'):
+    """Read (misspelling, correct spelling) pairs, one tab-separated pair per line."""
+    pairs = []
+    with open(path, encoding=encoding) as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) >= 2 and fields[0] and fields[1]:
+                pairs.append((fields[0], fields[1]))
+    return pairs
+
+
+def recall(noisy_vocabulary, misspellings):
+    """Return the share of *misspellings* whose correction is suggested.
+
+    *noisy_vocabulary* maps correct words to misspellings; a pair
+    (misspelling, correct) counts if correct is among the lookup results
+    of misspelling in its inversion.
+    """
+    if not misspellings:
+        return 0.0
+    spellchecker = HfstTransducer(noisy_vocabulary)
+    spellchecker.invert()
+    found = sum(1 for misspelling, correct in misspellings
+                if correct in {output for output, _ in
+                               spellchecker.lookup(misspelling)})
+    return found / len(misspellings)
+
+
+def pruning_report(vocabulary, errors, misspellings, thresholds=(), beams=(),
+                   max_states=None):
+    """Compare pruned compositions of *vocabulary* and *errors* with the full one.
+
+    Return a list of dicts, one for the full composition (made with
+    HfstTransducer.compose and minimized) and one for each of
+    *thresholds* and *beams*, with the states and arcs of the result, the
+    states saved, the recall on the (misspelling, correct) pairs
+    *misspellings* and the recall lost.
+    """
+    full = HfstTransducer(vocabulary)
+    full.compose(errors)
+    full.minimize()
+    full_recall = recall(full, misspellings)
+    rows = [{'pruning': 'none',
+             'states': full.number_of_states(),
+             'arcs': full.number_of_arcs(),
+             'states_saved': 0,
+             'recall': full_recall,
+             'recall_lost': 0.0}]
+    settings = [('threshold', value) for value in thresholds] + \
+        [('beam', value) for value in beams]
+    for kind, value in settings:
+        pruned = pruned_compose(vocabulary, errors, max_states=max_states,
+                                **{kind: value})
+        pruned_recall = recall(pruned, misspellings)
+        rows.append({'pruning': '%s %s' % (kind, value),
+                     'states': pruned.number_of_states(),
+                     'arcs': pruned.number_of_arcs(),
+                     'states_saved': full.number_of_states() -
+                     pruned.number_of_states(),
+                     'recall': pruned_recall,
+                     'recall_lost': full_recall - pruned_recall})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Report the states saved and the recall lost by pruned '
+                    'composition of a vocabulary with an error model.')
+    parser.add_argument('vocabulary', help='vocabulary .hfst file')
+    parser.add_argument('errors', help='error model .hfst file')
+    parser.add_argument('misspellings',
+                        help='held-out misspellings: misspelling TAB correct')
+    parser.add_argument('--threshold', type=float, nargs='*', default=[])
+    parser.add_argument('--beam', type=float, nargs='*', default=[])
+    parser.add_argument('--max-states', type=int, default=None)
+    args = parser.parse_args(argv)
+    rows = pruning_report(HfstTransducer.read_from_file(args.vocabulary),
+                          HfstTransducer.read_from_file(args.errors),
+                          read_misspellings(args.misspellings),
+                          args.threshold, args.beam, args.max_states)
+    print(json.dumps(rows, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+"""An asyncio lookup service with micro-batching.
+
+The server loads named transducers from .hfst files at startup and answers
+lookup requests over a TCP or Unix socket. Requests and responses are JSON
+objects, one per line:
+
+    {"id": 1, "transducer": "analyzer", "input": "skies"}
+    {"id": 1, "input": "skies", "output": [["sky+N+Pl", 0.0]]}
+
+Requests that arrive within a short batching window are collected into one
+batch, duplicate inputs are looked up once and the batch is run in a pool
+of worker processes, each of which has read the transducers once.
+
+Start a server and run a load test against it:
+
+    python3 -m compmorph.service serve --tcp 127.0.0.1:8765 analyzer=en.hfst
+    python3 -m compmorph.service client --tcp 127.0.0.1:8765 \\
+        --transducer analyzer english-words.txt
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from hfst_dev import HfstTransducer
+
+from compmorph.benchmark import percentile
+from compmorph.bulk import optimized_for_lookup, read_words
+
+DEFAULT_WINDOW = 0.002
+DEFAULT_MAX_BATCH = 256
+
+# The transducers of a worker process, set by _load_transducers.
+_transducers = None
+
+
+def _load_transducers(paths):
+    global _transducers
+    _transducers = {name: optimized_for_lookup(HfstTransducer.read_from_file(path))
+                    for name, path in paths.items()}
+
+
+def _warm_up():
+    # Run once in every worker at startup, after _load_transducers.
+    return sorted(_transducers)
+
+
+def _lookup_batch(name, inputs):
+    transducer = _transducers[name]
+    return [transducer.lookup(input) for input in inputs]
+
+
+class LookupServer:
+    """Answer lookup requests with the transducers in *paths*.
+
+    *paths* maps transducer names to .hfst files. Requests are collected
+    for at most *window* seconds or until *max_batch* requests are waiting
+    and then run in a pool of *workers* processes.
+    """
+
+    def __init__(self, paths, workers=None, window=DEFAULT_WINDOW,
+                 max_batch=DEFAULT_MAX_BATCH):
+        self.paths = dict(paths)
+        self.workers = workers or os.cpu_count() or 1
+        self.window = window
+        self.max_batch = max_batch
+        self._executor = None
+        self._queue = None
+        self._batcher = None
+        self._in_flight = None
+        # The running batches; asyncio keeps only weak references to tasks.
+        self._running = set()
+        self.requests = 0
+        self.batches = 0
+
+    async def start(self):
+        """Start the workers and wait until each has loaded the transducers.
+
+        Raise an exception, and leave no workers running, if a file is
+        missing or a worker fails to load it.
+        """
+        for path in self.paths.values():
+            if not os.path.isfile(path):
+                raise FileNotFoundError('no such transducer file: %s' % path)
+        self._executor = ProcessPoolExecutor(
+            self.workers, initializer=_load_transducers,
+            initargs=(self.paths,))
+        # The pool starts its processes lazily; one task per worker starts
+        # them all now, so that loading does not delay the first requests.
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*[loop.run_in_executor(self._executor,
+                                                        _warm_up)
+                                   for _ in range(self.workers)])
+        except Exception as e:
+            self._executor.shutdown()
+            self._executor = None
+            raise RuntimeError('could not load the transducers: %s' % e) from e
+        self._queue = asyncio.Queue()
+        self._in_flight = asyncio.Semaphore(2 * self.workers)
+        self._batcher = asyncio.ensure_future(self._collect_batches())
+
+    async def close(self):
+        if self._batcher is not None:
+            self._batcher.cancel()
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    async def lookup(self, name, input):
+        """Return the result of looking up *input* with transducer *name*."""
+        if name not in self.paths:
+            raise KeyError('no such transducer: %s' % name)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((name, input, future))
+        return await future
+
+    async def _collect_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(),
+                                                        timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._in_flight.acquire()
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            self.batches += 1
+            self.requests += len(batch)
+            requests = {}
+            for name, input, future in batch:
+                requests.setdefault(name, {}).setdefault(input, []).append(future)
+            for name, futures_by_input in requests.items():
+                inputs = list(futures_by_input)
+                try:
+                    results = await loop.run_in_executor(
+                        self._executor, _lookup_batch, name, inputs)
+                except Exception as e:
+                    for futures in futures_by_input.values():
+                        for future in futures:
+                            if not future.done():
+                                future.set_exception(e)
+                    continue
+                for input, result in zip(inputs, results):
+                    for future in futures_by_input[input]:
+                        if not future.done():
+                            future.set_result(result)
+        finally:
+            self._in_flight.release()
+
+    async def handle_connection(self, reader, writer):
+        # Requests of one connection are served concurrently; responses are
+        # matched to requests by their id.
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.ensure_future(self._respond(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def _respond(self, line, writer):
+        response = {}
+        try:
+            request = json.loads(line)
+            response['id'] = request.get('id')
+            response['input'] = request['input']
+            response['output'] = await self.lookup(request['transducer'],
+                                                   request['input'])
+        except Exception as e:
+            # Any failure, e.g. an HFST error in a worker or a broken pool,
+            # is reported to the client rather than leaving it waiting.
+            response['error'] = str(e) or type(e).__name__
+        writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8')
+                     + b'\n')
+        await writer.drain()
+
+    def stats(self):
+        return {'requests': self.requests, 'batches': self.batches,
+                'average_batch': self.requests / self.batches
+                if self.batches else 0.0}
+
+
+async def serve(paths, host=None, port=None, unix_path=None, **kwargs):
+    """Run a LookupServer on a TCP or Unix socket until cancelled."""
+    server = LookupServer(paths, **kwargs)
+    await server.start()
+    if unix_path is not None:
+        listener = await asyncio.start_unix_server(server.handle_connection,
+                                                   unix_path)
+    else:
+        listener = await asyncio.start_server(server.handle_connection,
+                                              host, port)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.close()
+
+
+async def open_connection(host=None, port=None, unix_path=None):
+    if unix_path is not None:
+        return await asyncio.open_unix_connection(unix_path, limit=2 ** 20)
+    return await asyncio.open_connection(host, port, limit=2 ** 20)
+
+
+async def load_test(transducer, words, host=None, port=None, unix_path=None,
+                    concurrency=64):
+    """Send lookups of *words* to a server and measure them.
+
+    *concurrency* requests are kept in flight at a time over one
+    connection. Return a dict with the throughput and the p50/p95/p99
+    latencies in milliseconds. Raise ConnectionError if the server closes
+    the connection before answering all requests.
+    """
+    reader, writer = await open_connection(host, port, unix_path)
+    pending = {}
+    latencies = []
+    errors = 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async def read_responses():
+        nonlocal errors
+        while pending:
+            line = await reader.readline()
+            if not line:
+                # Free the slots of the lost requests, so that the sender
+                # does not wait for them forever.
+                lost = len(pending)
+                pending.clear()
+                for _ in range(lost):
+                    slots.release()
+                raise ConnectionError('the server closed the connection '
+                                      'with %i requests pending' % lost)
+            response = json.loads(line)
+            started = pending.pop(response['id'])
+            latencies.append(time.perf_counter() - started)
+            if 'error' in response:
+                errors += 1
+            slots.release()
+
+    start = time.perf_counter()
+    reading = None
+    try:
+        for id, word in enumerate(words):
+            await slots.acquire()
+            if reading is not None and reading.done() and \
+                    reading.exception() is not None:
+                break
+            pending[id] = time.perf_counter()
+            request = {'id': id, 'transducer': transducer, 'input': word}
+            writer.write(json.dumps(request, ensure_ascii=False)
+                         .encode('utf-8') + b'\n')
+            await writer.drain()
+            if reading is None or reading.done():
+                reading = asyncio.ensure_future(read_responses())
+        if reading is not None:
+            await reading
+    finally:
+        writer.close()
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    return {'requests': len(latencies), 'errors': errors, 'seconds': seconds,
+            'requests_per_second': len(latencies) / seconds if seconds else 0.0,
+            'latency_ms': {'p50': percentile(latencies, 50) * 1e3,
+                           'p95': percentile(latencies, 95) * 1e3,
+                           'p99': percentile(latencies, 99) * 1e3}}
+
+
+def _parse_address(parser, args):
+    if args.unix is not None:
+        return {'unix_path': args.unix}
+    if args.tcp is None:
+        parser.error('give either --tcp HOST:PORT or --unix PATH')
+    host, _, port = args.tcp.rpartition(':')
+    return {'host': host or None, 'port': int(port)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Serve transducer lookups over a socket, or load test '
+                    'such a server.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name in ('serve', 'client'):
+        subparser = subparsers.add_parser(name)
+        subparser.add_argument('--tcp', metavar='HOST:PORT')
+        subparser.add_argument('--unix', metavar='PATH')
+    serve_parser = subparsers.choices['serve']
+    serve_parser.add_argument('transducers', nargs='+', metavar='NAME=FILE',
+                              help='transducers to load, e.g. analyzer=en.hfst')
+    serve_parser.add_argument('-j', '--workers', type=int, default=None)
+    serve_parser.add_argument('--window', type=float, default=DEFAULT_WINDOW,
+                              help='batching window in seconds '
+                                   '(default: %(default)s)')
+    serve_parser.add_argument('--max-batch', type=int,
+                              default=DEFAULT_MAX_BATCH)
+    client_parser = subparsers.choices['client']
+    client_parser.add_argument('--transducer', required=True)
+    client_parser.add_argument('--concurrency', type=int, default=64)
+    client_parser.add_argument('word_list',
+                               help='file with one word per line')
+    args = parser.parse_args(argv)
+    address = _parse_address(parser, args)
+
+    if args.command == 'serve':
+        paths = {}
+        for item in args.transducers:
+            name, sep, path = item.partition('=')
+            if not sep:
+                parser.error('expected NAME=FILE, got ' + item)
+            paths[name] = path
+        try:
+            asyncio.run(serve(paths, workers=args.workers, window=args.window,
+                              max_batch=args.max_batch, **address))
+        except KeyboardInterrupt:
+            pass
+    else:
+        words = list(read_words(args.word_list))
+        result = asyncio.run(load_test(args.transducer, words,
+                                       concurrency=args.concurrency, **address))
+        json.dump(result, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Symbols of HFST transducers as the search modules use them.
+
+The modules that read the arcs of a transducer into Python (paths, nbest,
+correction, pruning) and those that build regular expressions from
+symbols (correction, confusion, estimate) share these helpers:
+
+    from compmorph.symbols import IDENTITY, is_visible, quote, tokenize
+    tokenize('cheese+N', {'ch', '+N'})   # ['ch', 'e', 'e', 's', 'e', '+N']
+    regex('%s:%s' % (quote('+N'), quote('0')))
+"""
+
+from hfst_dev import EPSILON, is_diacritic
+
+# The special symbols of HFST that match symbols outside the alphabet of a
+# transducer: the identity symbol copies them, the unknown symbol maps them
+# to any other symbol.
+IDENTITY = '@_IDENTITY_SYMBOL_@'
+UNKNOWN = '@_UNKNOWN_SYMBOL_@'
+
+
+def is_visible(symbol, filter_flags=True):
+    """Return whether *symbol* shows in a string of a path.
+
+    Epsilons never do, and flag diacritics do not if *filter_flags* is true.
+    """
+    return symbol != EPSILON and not (filter_flags and is_diacritic(symbol))
+
+
+def quote(symbol):
+    """Return *symbol* quoted for a regular expression of hfst_dev.regex."""
+    return '"%s"' % symbol.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def tokenize(string, alphabet, longest=None):
+    """Split *string* into symbols of *alphabet*, taking the longest match first.
+
+    Characters that do not start any symbol of *alphabet* become symbols of
+    their own. *longest* is the length of the longest symbol of *alphabet*;
+    pass it when tokenizing many strings with the same alphabet.
+    """
+    if longest is None:
+        longest = max((len(symbol) for symbol in alphabet), default=1)
+    tokens = []
+    position = 0
+    while position < len(string):
+        for length in range(min(longest, len(string) - position), 0, -1):
+            if string[position:position + length] in alphabet:
+                break
+        else:
+            length = 1
+        tokens.append(string[position:position + length])
+        position += length
+    return tokens
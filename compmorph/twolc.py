@@ -0,0 +1,178 @@
+"""Combining compiled twolc rules with a lexicon.
+
+Lectures 6 and 7 combine a lexicon with two-level rules as
+
+    twolc_rules = compile_twolc_file('en_adjectives.twolc')
+    twolc_rule = intersect(twolc_rules)
+    twolc = compose((lexicon, twolc_rule))
+
+intersect_tree computes the same intersection as a balanced tree of
+pairwise intersections. The pairs of one level are independent of each
+other and are run in a process pool, and every intermediate result is
+minimized before it is passed on to the next level.
+
+compose_intersect gives the same result as the last two lines without
+building the intersection of the rules at all: the lexicon and all rules
+are traversed together and only the reachable combinations of their states
+are created. Compare the two ways with
+
+    python3 -m compmorph.twolc en_adjectives.lexc en_adjectives.twolc
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from hfst_dev import HfstTransducer, compile_lexc_file, compile_twolc_file, \
+    compose, intersect
+
+from compmorph.benchmark import call_isolated, peak_rss_kb
+
+logger = logging.getLogger(__name__)
+
+
+def size(transducer):
+    """Return the number of states and arcs of *transducer* as a pair."""
+    return transducer.number_of_states(), transducer.number_of_arcs()
+
+
+def _intersect_pair(args):
+    # Transducers cannot be pickled, so the workers pass them as files.
+    first_path, second_path, result_path, minimize = args
+    result = HfstTransducer.read_from_file(first_path)
+    result.intersect(HfstTransducer.read_from_file(second_path))
+    if minimize:
+        result.minimize()
+    result.write_to_file(result_path)
+    return size(result)
+
+
+def intersect_tree(rules, processes=None, minimize=True, levels=None):
+    """Return the intersection of the transducers in *rules*.
+
+    The result is equivalent to hfst_dev.intersect(rules). The rules are
+    intersected pairwise, level by level, in a pool of *processes* worker
+    processes (by default one per CPU; 1 runs everything in this process).
+    If *minimize* is true, each intermediate result is minimized. The
+    states and arcs of the results of each level are logged, and if a list
+    is given as *levels*, a list of (states, arcs) pairs is appended to it
+    for each level. *rules* are not modified.
+    """
+    rules = list(rules)
+    if not rules:
+        raise ValueError('no rules to intersect')
+    if len(rules) == 1:
+        result = HfstTransducer(rules[0])
+        if minimize:
+            result.minimize()
+        return result
+    directory = tempfile.mkdtemp(prefix='compmorph-intersect-')
+    pool = None
+    try:
+        paths = []
+        for index, rule in enumerate(rules):
+            path = os.path.join(directory, 'rule-%i.hfst' % index)
+            rule.write_to_file(path)
+            paths.append(path)
+        if processes is None:
+            processes = min(os.cpu_count() or 1, len(rules) // 2)
+        if processes > 1:
+            pool = multiprocessing.Pool(processes)
+        level = 0
+        while len(paths) > 1:
+            level += 1
+            tasks = []
+            for index in range(0, len(paths) - 1, 2):
+                result_path = os.path.join(directory,
+                                           'level-%i-%i.hfst' % (level, index))
+                tasks.append((paths[index], paths[index + 1], result_path,
+                              minimize))
+            if pool is None:
+                sizes = [_intersect_pair(task) for task in tasks]
+            else:
+                sizes = pool.map(_intersect_pair, tasks)
+            for index, (states, arcs) in enumerate(sizes):
+                logger.info('level %i, intersection %i: %i states, %i arcs',
+                            level, index, states, arcs)
+            if levels is not None:
+                levels.append(sizes)
+            next_paths = [task[2] for task in tasks]
+            if len(paths) % 2:
+                next_paths.append(paths[-1])
+            paths = next_paths
+        return HfstTransducer.read_from_file(paths[0])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def compose_intersect(lexicon, rules, invert=False):
+    """Return compose((lexicon, intersect(rules))) without building intersect(rules).
+
+    This uses HfstTransducer.compose_intersect, which creates only the
+    state combinations of *lexicon* and *rules* that are reachable. If
+    *invert* is true, the rules are applied to the input side of *lexicon*
+    instead of its output side. *lexicon* and *rules* are not modified.
+    """
+    result = HfstTransducer(lexicon)
+    result.compose_intersect(tuple(rules), invert)
+    return result
+
+
+def _build(method, lexc_path, twolc_path, result_path):
+    lexicon = compile_lexc_file(lexc_path)
+    rules = compile_twolc_file(twolc_path)
+    start = time.perf_counter()
+    if method == 'compose-intersect':
+        result = compose_intersect(lexicon, rules)
+    else:
+        result = compose((lexicon, intersect(rules)))
+    seconds = time.perf_counter() - start
+    result.write_to_file(result_path)
+    states, arcs = size(result)
+    return {'method': method, 'seconds': seconds, 'states': states,
+            'arcs': arcs, 'peak_rss_kb': peak_rss_kb()}
+
+
+def benchmark_compose_intersect(lexc_path, twolc_path):
+    """Build the lexical transducer of *lexc_path* and *twolc_path* both ways.
+
+    Each way is run in a fresh process. Return a dict with the time, size
+    and peak memory of each and whether the two results are equivalent.
+    """
+    directory = tempfile.mkdtemp(prefix='compmorph-compose-intersect-')
+    try:
+        results = []
+        paths = []
+        for method in ('intersect-then-compose', 'compose-intersect'):
+            path = os.path.join(directory, method + '.hfst')
+            results.append(call_isolated(_build, method, lexc_path,
+                                         twolc_path, path))
+            paths.append(path)
+        first, second = (HfstTransducer.read_from_file(path) for path in paths)
+        return {'lexc': lexc_path, 'twolc': twolc_path, 'results': results,
+                'equivalent': first.compare(second)}
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compare compose((lexicon, intersect(rules))) with '
+                    'intersecting composition.')
+    parser.add_argument('lexc', help='lexc file')
+    parser.add_argument('twolc', help='twolc file')
+    args = parser.parse_args(argv)
+    print(json.dumps(benchmark_compose_intersect(args.lexc, args.twolc),
+                     indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""Weight pushing and weighted determinization.
+
+Section 2 of Lecture 8 discusses semirings and weighted determinization.
+This module applies them to a weighted transducer such as the spell
+checker of Lecture 3: the weights are pushed towards the initial state,
+so that the weight of a partial path already tells how heavy its best
+completion is, and the transducer is determinized in the tropical
+semiring. A best-first search (compmorph.nbest) then finds the best
+outputs with fewer detours:
+
+    from compmorph.weighted import optimize_weights
+    result = optimize_weights(spellchecker, max_states=100000,
+                              time_limit=60)
+    print(result.reason, result.states_before, result.states_after)
+    spellchecker = result.transducer
+
+Weighted determinization does not terminate for every transducer (it
+needs the twins property), and when it does the result can be
+exponentially larger. It is therefore run in a separate process that is
+stopped when it exceeds *time_limit* seconds (DEFAULT_TIME_LIMIT unless
+given) or *max_memory_mb* megabytes; a result with more than *max_states*
+states is rejected too, but only once it is complete. In these cases the
+transducer is only pushed.
+
+    python3 -m compmorph.weighted spellchecker.hfst misspellings.txt -k 5
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import signal
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+from hfst_dev import HfstTransducer, ImplementationType
+
+from compmorph.bulk import read_words
+from compmorph.nbest import NBestLookup
+
+# The result of optimize_weights: the transducer, whether its weights were
+# pushed and it was determinized, why determinization was given up (None
+# if it was not), the numbers of states before and after and the time.
+OptimizeResult = namedtuple('OptimizeResult',
+                            ['transducer', 'pushed', 'determinized', 'reason',
+                             'states_before', 'states_after', 'seconds'])
+
+
+# Seconds after which determinization is given up, so that a transducer
+# without the twins property does not make it run forever.
+DEFAULT_TIME_LIMIT = 300
+
+# The exit code of the determinizing process when it runs out of memory.
+_OUT_OF_MEMORY = 3
+
+
+def _editable(transducer):
+    # A copy of transducer that is not in optimized lookup format.
+    result = HfstTransducer(transducer)
+    if result.get_type() in (ImplementationType.HFST_OL_TYPE,
+                             ImplementationType.HFST_OLW_TYPE):
+        result.remove_optimization()
+    return result
+
+
+def push_weights(transducer, to='start'):
+    """Return a copy of *transducer* with its weights pushed to the start or end."""
+    if to not in ('start', 'end'):
+        raise ValueError('to must be start or end')
+    result = _editable(transducer)
+    if to == 'start':
+        result.push_weights_to_start()
+    else:
+        result.push_weights_to_end()
+    return result
+
+
+def _determinize_file(input_path, output_path, max_memory_mb):
+    if max_memory_mb is not None:
+        limit = max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    try:
+        transducer = HfstTransducer.read_from_file(input_path)
+        transducer.determinize()
+        transducer.write_to_file(output_path)
+    except MemoryError:
+        sys.exit(_OUT_OF_MEMORY)
+
+
+def determinize_capped(transducer, max_states=None, max_memory_mb=None,
+                       time_limit=DEFAULT_TIME_LIMIT):
+    """Determinize *transducer* in a separate process, within the given caps.
+
+    Return a pair (result, reason): the determinized copy and None, or
+    None and the reason: 'time', 'states' or 'memory' for the cap that was
+    hit, or 'error' if the process failed otherwise. The process is
+    stopped after *time_limit* seconds (None waits forever) and when it
+    uses more than *max_memory_mb* megabytes. *max_states* cannot stop
+    it: a result with more states is only rejected once it is complete.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = os.path.join(directory, 'input.hfst')
+        output_path = os.path.join(directory, 'output.hfst')
+        transducer.write_to_file(input_path)
+        context = multiprocessing.get_context('spawn')
+        process = context.Process(target=_determinize_file,
+                                  args=(input_path, output_path,
+                                        max_memory_mb))
+        process.start()
+        process.join(time_limit)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+            return None, 'time'
+        if process.exitcode == _OUT_OF_MEMORY or \
+                process.exitcode == -signal.SIGKILL or \
+                (process.exitcode == -signal.SIGABRT and
+                 max_memory_mb is not None):
+            # SIGKILL comes from the kernel's out-of-memory killer, SIGABRT
+            # from a failed allocation in C++ under the memory limit.
+            return None, 'memory'
+        if process.exitcode != 0 or not os.path.exists(output_path):
+            return None, 'error'
+        result = HfstTransducer.read_from_file(output_path)
+    if max_states is not None and result.number_of_states() > max_states:
+        return None, 'states'
+    return result, None
+
+
+def optimize_weights(transducer, determinize=True, minimize=True,
+                     max_states=None, max_memory_mb=None,
+                     time_limit=DEFAULT_TIME_LIMIT):
+    """Push the weights of *transducer* to the start and determinize it.
+
+    If *determinize* is true, the pushed transducer is determinized within
+    the caps of determinize_capped, and minimized if *minimize* is true.
+    Return an OptimizeResult; *transducer* is not modified.
+    """
+    start = time.perf_counter()
+    states_before = transducer.number_of_states()
+    result = push_weights(transducer)
+    determinized = False
+    reason = None
+    if determinize:
+        deterministic, reason = determinize_capped(result, max_states,
+                                                   max_memory_mb, time_limit)
+        if deterministic is not None:
+            result = deterministic
+            determinized = True
+            if minimize:
+                result.minimize()
+            # Minimization may move weights again.
+            result.push_weights_to_start()
+    return OptimizeResult(result, True, determinized, reason, states_before,
+                          result.number_of_states(),
+                          time.perf_counter() - start)
+
+
+def nbest_latency(transducer, inputs, k=5, **kwargs):
+    """Return the average seconds per input and expansions of NBestLookup.
+
+    Keyword arguments are passed to NBestLookup.lookup.
+    """
+    lookup = NBestLookup(transducer)
+    expansions = 0
+    start = time.perf_counter()
+    for input in inputs:
+        stats = {}
+        lookup.lookup(input, k, stats=stats, **kwargs)
+        expansions += stats['expansions']
+    count = max(len(inputs), 1)
+    return (time.perf_counter() - start) / count, expansions / count
+
+
+def compare_optimization(transducer, inputs, k=5, result=None, **kwargs):
+    """Report how optimize_weights changes the n-best lookup of *inputs*.
+
+    Keyword arguments are passed to optimize_weights, unless the
+    OptimizeResult of *transducer* is given as *result*. Return a dict with
+    the sizes, the optimization time and reason, and the average seconds
+    and expanded search nodes per input before and after.
+    """
+    inputs = list(inputs)
+    if result is None:
+        result = optimize_weights(transducer, **kwargs)
+    seconds_before, expansions_before = nbest_latency(transducer, inputs, k)
+    seconds_after, expansions_after = nbest_latency(result.transducer, inputs,
+                                                    k)
+    return {'inputs': len(inputs),
+            'k': k,
+            'determinized': result.determinized,
+            'reason': result.reason,
+            'optimize_seconds': result.seconds,
+            'states_before': result.states_before,
+            'states_after': result.states_after,
+            'nbest_seconds_before': seconds_before,
+            'nbest_seconds_after': seconds_after,
+            'expansions_before': expansions_before,
+            'expansions_after': expansions_after}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Push weights, determinize and measure n-best lookup.')
+    parser.add_argument('transducer', help='weighted .hfst file')
+    parser.add_argument('inputs', help='inputs to look up, one per line')
+    parser.add_argument('-k', type=int, default=5, help='number of results')
+    parser.add_argument('--no-determinize', action='store_true')
+    parser.add_argument('--max-states', type=int, default=None)
+    parser.add_argument('--max-memory', type=int, default=None,
+                        metavar='MB')
+    parser.add_argument('--time-limit', type=float,
+                        default=DEFAULT_TIME_LIMIT, metavar='SECONDS',
+                        help='give up determinizing after this time '
+                             '(default: %(default)s)')
+    parser.add_argument('-o', '--output',
+                        help='write the optimized transducer here')
+    args = parser.parse_args(argv)
+    transducer = HfstTransducer.read_from_file(args.transducer)
+    result = optimize_weights(transducer, not args.no_determinize,
+                              max_states=args.max_states,
+                              max_memory_mb=args.max_memory,
+                              time_limit=args.time_limit)
+    print(json.dumps(compare_optimization(transducer,
+                                          read_words(args.inputs), args.k,
+                                          result), indent=2))
+    if args.output:
+        result.transducer.write_to_file(args.output)
+
+
+if __name__ == '__main__':
+    main()
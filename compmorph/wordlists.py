@@ -0,0 +1,113 @@
+"""Memory-mapped access to word lists.
+
+Reading a word list with readlines(), as suggested in Assignment 5.1c,
+creates one Python string per line before the first lookup is done.
+WordList maps the file into memory instead and keeps only the offsets of
+the lines. A line is decoded when it is asked for, so a shard of a large
+corpus can be read without touching the rest of the file.
+
+    with WordList('german-words.txt') as words:
+        print(len(words), words[0], words[-1])
+        for word in words.lines(1000, 2000):
+            ...
+"""
+
+import mmap
+from array import array
+
+# The ASCII characters that str.strip() removes.
+_ASCII_WHITESPACE = bytes(i for i in range(128) if chr(i).isspace())
+
+
+class WordList:
+    """A read-only, memory-mapped file with one word per line."""
+
+    def __init__(self, path, encoding='utf-8'):
+        self.path = path
+        self.encoding = encoding
+        with open(path, 'rb') as f:
+            if f.seek(0, 2) == 0:
+                # mmap cannot map an empty file.
+                self._data = b''
+            else:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = self._index_lines()
+
+    def _index_lines(self):
+        # Start offsets of all lines followed by the end of the data, so that
+        # line i is data[offsets[i]:offsets[i + 1]].
+        offsets = array('q', [0])
+        data = self._data
+        end = len(data)
+        position = data.find(b'\n')
+        while position != -1:
+            offsets.append(position + 1)
+            position = data.find(b'\n', position + 1)
+        if offsets[-1] != end:
+            offsets.append(end)
+        return offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _line_range(self, index):
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError('line number out of range')
+        return self._offsets[index], self._offsets[index + 1]
+
+    def line_bytes(self, index):
+        """Return line *index* as a memoryview of the mapped file.
+
+        No copy is made. The trailing line break is not included.
+        """
+        start, end = self._line_range(index)
+        view = memoryview(self._data)[start:end]
+        if view[-1:] == b'\n':
+            view = view[:-1]
+        if view[-1:] == b'\r':
+            view = view[:-1]
+        return view
+
+    def __getitem__(self, index):
+        """Return line *index* decoded, without the trailing line break."""
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        start, end = self._line_range(index)
+        return self._data[start:end].decode(self.encoding).rstrip('\r\n')
+
+    def is_blank(self, index):
+        """Return whether line *index* contains only whitespace.
+
+        The test is done on the bytes; only a line with non-ASCII bytes is
+        decoded, so that it is blank exactly when compmorph.bulk.read_words
+        skips it, e.g. for a no-break space. The encoding must be
+        ASCII-compatible, as UTF-8 and Latin-1 are.
+        """
+        start, end = self._line_range(index)
+        line = self._data[start:end].strip(_ASCII_WHITESPACE)
+        if not line or line.isascii():
+            return not line
+        return not line.decode(self.encoding).strip()
+
+    def lines(self, start=0, stop=None):
+        """Yield the decoded lines from *start* up to, not including, *stop*."""
+        if stop is None or stop > len(self):
+            stop = len(self)
+        for index in range(start, stop):
+            yield self[index]
+
+    def __iter__(self):
+        return self.lines()
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,412 @@
+"""Running xfst scripts command by command.
+
+compile_xfst_script runs a whole script at once, so it does not tell which
+of its definitions is slow or produces a huge network. profile_xfst_script
+runs the commands of a script one at a time with XfstCompiler.parse_line and
+records for each of them the wall-clock time, how much it raised the peak
+memory of the process, and the number of states, arcs and symbols of the
+network that the command defined or left on top of the stack:
+
+    from compmorph.xfst import profile_xfst_file, profile_summary
+    profile = profile_xfst_file('en_adjectives.xfst')
+    print(profile_summary(profile))
+
+or from the command line:
+
+    python3 -m compmorph.xfst en_adjectives.xfst
+
+XfstBatchRunner runs the commands of a script that build networks once,
+keeps the result, and then answers `apply up`, `apply down`,
+`upper-words`, `lower-words` and the random-* commands for any number of
+inputs, returning Python objects instead of printing:
+
+    from compmorph.xfst import XfstBatchRunner
+    runner = XfstBatchRunner.from_script(spell_checker_script)
+    results = runner.apply_up(['right', 'or', 'for'])
+    print(results['right'])
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from collections import namedtuple
+
+from hfst_dev import HfstTransducer, XfstCompiler, read_att_transducer
+
+# compile_cache imports this module in turn, so both import the other as a
+# module and use its names only when called.
+from compmorph import compile_cache
+from compmorph.benchmark import peak_rss_kb
+from compmorph.bulk import optimized_for_lookup, read_words
+
+# Commands that may span several lines and end with a semicolon.
+_STATEMENTS = ('define', 'regex', 'read regex')
+# Commands that read input words from the following lines when they are
+# given without arguments.
+_APPLY = ('apply up', 'apply down', 'up', 'down')
+# Commands that do not change the stack, so no network is measured after
+# them.
+_NO_NETWORK = ('apply', 'up', 'down', 'print', 'echo', 'set', 'save', 'write',
+               'view', 'lower-words', 'upper-words', 'words', 'random-lower',
+               'random-upper', 'random-words', 'lookup', 'test', 'quit',
+               'exit', 'hfst')
+
+# Commands that only print something. XfstBatchRunner skips them when it
+# builds its network.
+_PRINTING = ('apply', 'up', 'down', 'print', 'echo', 'view', 'lower-words',
+             'upper-words', 'words', 'random-lower', 'random-upper',
+             'random-words', 'lookup', 'test')
+
+# The profile of one command. kind is 'define' for definitions (name is
+# then the defined name) and 'stack' for other commands that change the
+# stack. peak_rss_kb is the peak memory of the process after the command
+# and peak_increase_kb how much the command raised it. states, arcs and
+# symbols are None if nothing was measured.
+CommandProfile = namedtuple('CommandProfile',
+                            ['index', 'command', 'kind', 'name', 'status',
+                             'seconds', 'peak_rss_kb', 'peak_increase_kb',
+                             'states', 'arcs', 'symbols'])
+
+
+def strip_comment(line):
+    """Return the line *line* of an xfst script without its comment.
+
+    A comment starts with ! outside double quotes, unless escaped with %.
+    """
+    quoted = False
+    escaped = False
+    for index, char in enumerate(line):
+        if escaped:
+            escaped = False
+        elif char == '%':
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif char == '!' and not quoted:
+            return line[:index]
+    return line
+
+
+def _ends_statement(line):
+    quoted = False
+    escaped = False
+    for char in line:
+        if escaped:
+            escaped = False
+        elif char == '%':
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif char == ';' and not quoted:
+            return True
+    return False
+
+
+def split_commands(script):
+    """Split the xfst *script* into a list of commands.
+
+    Comments and empty lines are removed. Definitions and regular
+    expressions extend up to their semicolon, and `apply up` or
+    `apply down` without an argument takes the following lines up to
+    `END;` as its input words.
+    """
+    return [command for _, command in _numbered_commands(script)]
+
+
+def _numbered_commands(script):
+    # Return (line number, command) pairs as split_commands splits the
+    # commands; the line number, counted from 1, is that of the first
+    # line of the command.
+    lines = [strip_comment(line).strip() for line in script.splitlines()]
+    commands = []
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        index += 1
+        if not line:
+            continue
+        line_number = index
+        command = [line]
+        if line in _APPLY:
+            while index < len(lines) and lines[index] != 'END;':
+                if lines[index]:
+                    command.append(lines[index])
+                index += 1
+            index += 1
+        elif line.split()[0] in _STATEMENTS or line.startswith('read regex'):
+            # 'define Name' without a body is complete without a semicolon.
+            if not (line.split()[0] == 'define' and len(line.split()) == 2):
+                while not _ends_statement(command[-1]) and index < len(lines):
+                    if lines[index]:
+                        command.append(lines[index])
+                    index += 1
+        commands.append((line_number, '\n'.join(command)))
+    return commands
+
+
+def _sizes(transducer):
+    return (transducer.number_of_states(), transducer.number_of_arcs(),
+            len(transducer.get_alphabet()))
+
+
+class _Measurer:
+    # Writes the network to measure, and only that one, to a temporary file
+    # in AT&T format and reads the sizes from there. This is done outside
+    # the timed part.
+
+    def __init__(self, compiler, directory):
+        self.compiler = compiler
+        self.path = os.path.join(directory, 'network.att')
+
+    def _top(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        if self.compiler.parse_line('write att > %s\n' % self.path):
+            return None, None, None
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return None, None, None
+        with open(self.path, encoding='utf-8') as f:
+            return _sizes(read_att_transducer(f, '@0@'))
+
+    def defined(self, name):
+        # push defined puts a copy of the network on the stack; it is
+        # popped again so that the stack is left as the script left it.
+        if self.compiler.parse_line('push defined %s\n' % name):
+            return None, None, None
+        try:
+            return self._top()
+        finally:
+            self.compiler.parse_line('pop stack\n')
+
+    def stack_top(self):
+        return self._top()
+
+
+def profile_xfst_script(script, compiler=None):
+    """Run the xfst *script* command by command and profile each command.
+
+    Return a list of CommandProfile objects in the order of the commands.
+    The commands are run in *compiler*, a new XfstCompiler by default.
+    """
+    if compiler is None:
+        compiler = XfstCompiler()
+    directory = tempfile.mkdtemp(prefix='compmorph-xfst-')
+    measurer = _Measurer(compiler, directory)
+    profile = []
+    try:
+        for index, command in enumerate(split_commands(script)):
+            words = command.split()
+            # Both readings are taken before the network is measured, so
+            # that the measuring does not count towards any command.
+            rss_before = peak_rss_kb()
+            start = time.perf_counter()
+            status = compiler.parse_line(command + '\n')
+            seconds = time.perf_counter() - start
+            rss = peak_rss_kb()
+            if status:
+                kind, name = 'other', None
+                states = arcs = symbols = None
+            elif words[0] == 'define':
+                kind, name = 'define', words[1].rstrip(';')
+                states, arcs, symbols = measurer.defined(name)
+            elif words[0] in _NO_NETWORK:
+                kind, name = 'other', None
+                states = arcs = symbols = None
+            else:
+                kind, name = 'stack', None
+                states, arcs, symbols = measurer.stack_top()
+            profile.append(CommandProfile(index, command, kind, name, status,
+                                          seconds, rss, rss - rss_before,
+                                          states, arcs, symbols))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return profile
+
+
+def profile_xfst_file(path, compiler=None):
+    """Like profile_xfst_script for the script in the file *path*."""
+    with open(path, encoding='utf-8') as f:
+        return profile_xfst_script(f.read(), compiler)
+
+
+def profile_summary(profile, key='seconds', top=None):
+    """Return a text table of *profile* sorted by *key*, largest first.
+
+    *key* is one of the numeric fields of CommandProfile, e.g. 'seconds'
+    or 'states'. If *top* is given, only that many rows are included.
+    """
+    rows = sorted(profile, key=lambda p: getattr(p, key) or 0, reverse=True)
+    if top is not None:
+        rows = rows[:top]
+    lines = ['%10s %10s %10s %8s %10s  %s' % ('seconds', 'states', 'arcs',
+                                               'symbols', '+peak kB',
+                                               'command')]
+    for p in rows:
+        command = p.command.split('\n')[0]
+        if len(command) > 50:
+            command = command[:47] + '...'
+        lines.append('%10.4f %10s %10s %8s %10i  %s' % (
+            p.seconds, '-' if p.states is None else p.states,
+            '-' if p.arcs is None else p.arcs,
+            '-' if p.symbols is None else p.symbols, p.peak_increase_kb,
+            command))
+    return '\n'.join(lines)
+
+
+class XfstBatchRunner:
+    """Apply the network built by an xfst script to many inputs.
+
+    The network on top of the stack of *compiler* after the script has
+    been run is used. Lookup-optimized copies for `apply down` and, inverted,
+    for `apply up` are created when first needed and kept, so nothing is
+    parsed or compiled again between inputs.
+    """
+
+    def __init__(self, compiler):
+        self.compiler = compiler
+        directory = tempfile.mkdtemp(prefix='compmorph-xfst-')
+        path = os.path.join(directory, 'stack.hfst')
+        try:
+            compiler.parse_line('save stack %s\n' % path)
+            transducers = []
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                transducers = compile_cache.read_transducers(path)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        if not transducers:
+            raise ValueError('the xfst stack is empty')
+        self.network = transducers[-1]
+        self._down = None
+        self._up = None
+
+    @classmethod
+    def from_script(cls, script):
+        """Run the commands of *script* that build networks and return a runner.
+
+        Commands that only print something, such as `apply up` or
+        `lower-words`, are skipped. Raise RuntimeError if a command fails.
+        """
+        compiler = XfstCompiler()
+        for line_number, command in _numbered_commands(script):
+            if command.split()[0] in _PRINTING:
+                continue
+            status = compiler.parse_line(command + '\n')
+            if status:
+                raise RuntimeError('line %i: %s failed with status %s'
+                                   % (line_number, command.split('\n')[0],
+                                      status))
+        return cls(compiler)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_script(f.read())
+
+    def _down_transducer(self):
+        if self._down is None:
+            self._down = optimized_for_lookup(self.network)
+        return self._down
+
+    def _up_transducer(self):
+        if self._up is None:
+            up = HfstTransducer(self.network)
+            up.invert()
+            up.minimize()
+            up.lookup_optimize()
+            self._up = up
+        return self._up
+
+    def apply_down(self, inputs):
+        """Return a dict mapping each of *inputs* to its `apply down` results.
+
+        The results are (string, weight) pairs as from HfstTransducer.lookup.
+        *inputs* is a string or handled as in compmorph.bulk.read_words.
+        """
+        return self._apply(self._down_transducer(), inputs)
+
+    def apply_up(self, inputs):
+        """Like apply_down, but for `apply up`."""
+        return self._apply(self._up_transducer(), inputs)
+
+    def _apply(self, transducer, inputs):
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        return {input: transducer.lookup(input)
+                for input in read_words(inputs)}
+
+    def _words(self, side, max_number, random):
+        network = HfstTransducer(self.network)
+        if side == 'upper':
+            network.input_project()
+        elif side == 'lower':
+            network.output_project()
+        kwargs = {'max_number': max_number, 'output': 'dict'}
+        if random:
+            kwargs['random'] = True
+        else:
+            kwargs['max_cycles'] = 0
+        paths = network.extract_paths(**kwargs)
+        return paths if side == 'both' else sorted(paths)
+
+    def upper_words(self, max_number=-1):
+        """Return the strings of the upper side as a sorted list.
+
+        Cyclic networks are cut off at their cycles, see extract_paths.
+        """
+        return self._words('upper', max_number, False)
+
+    def lower_words(self, max_number=-1):
+        """Return the strings of the lower side as a sorted list."""
+        return self._words('lower', max_number, False)
+
+    def words(self, max_number=-1):
+        """Return a dict mapping upper strings to (lower string, weight) pairs."""
+        return self._words('both', max_number, False)
+
+    def random_upper(self, number=15):
+        """Return *number* random strings of the upper side, as `random-upper`."""
+        return self._words('upper', number, True)
+
+    def random_lower(self, number=15):
+        """Return *number* random strings of the lower side, as `random-lower`."""
+        return self._words('lower', number, True)
+
+    def run(self, command, inputs=None):
+        """Run the xfst output command *command* and return its result.
+
+        *command* is one of 'apply up', 'up', 'apply down', 'down',
+        'upper-words', 'lower-words', 'words', 'random-upper' or
+        'random-lower'. The apply commands need *inputs*.
+        """
+        if command in ('apply up', 'up'):
+            return self.apply_up(inputs)
+        if command in ('apply down', 'down'):
+            return self.apply_down(inputs)
+        methods = {'upper-words': self.upper_words,
+                   'lower-words': self.lower_words, 'words': self.words,
+                   'random-upper': self.random_upper,
+                   'random-lower': self.random_lower}
+        if command not in methods:
+            raise ValueError('unsupported command: %s' % command)
+        return methods[command]()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Profile the commands of an xfst script.')
+    parser.add_argument('script', help='xfst script file')
+    parser.add_argument('-s', '--sort', default='seconds',
+                        choices=('seconds', 'states', 'arcs', 'symbols',
+                                 'peak_rss_kb', 'peak_increase_kb', 'index'),
+                        help='sort key of the summary (default: %(default)s)')
+    parser.add_argument('-n', '--top', type=int, default=None,
+                        help='show only this many commands')
+    args = parser.parse_args(argv)
+    profile = profile_xfst_file(args.script)
+    print(profile_summary(profile, args.sort, args.top))
+
+
+if __name__ == '__main__':
+    main()